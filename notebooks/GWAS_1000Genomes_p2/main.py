@@ -102,15 +102,48 @@ with herzog.Cell("markdown"):
     To see the entire list of Python packages, click the purple arrow to the right below.
     """
 
+# shared-cell: lazy-import
+with herzog.Cell("python"):
+    # Heavy packages are imported on first use, so that notebook startup only pays for the packages used.
+    # `print_import_times()` lists the time spent importing each package.
+    import sys
+    import time
+    import types
+    import importlib
+
+    import_times: dict = dict()
+
+    class LazyModule(types.ModuleType):
+        def _load(self):
+            name = self.__name__
+            if name not in sys.modules:
+                start = time.perf_counter()
+                importlib.import_module(name)
+                import_times[name] = time.perf_counter() - start
+            return sys.modules[name]
+
+        def __getattr__(self, attr):
+            return getattr(self._load(), attr)
+
+        def __setattr__(self, attr, value):
+            setattr(self._load(), attr, value)
+
+    def lazy_import(name):
+        return sys.modules.get(name) or LazyModule(name)
+
+    def print_import_times():
+        for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"{seconds:8.3f}s {name}")
+
 with herzog.Cell("python"):
     #%%capture
-    from firecloud import fiss
     import os
     import io
-    import pandas as pd
-    import numpy as np
-    import matplotlib.pyplot as plt
-    import seaborn as sns
+    fiss = lazy_import("firecloud.fiss")
+    pd = lazy_import("pandas")
+    np = lazy_import("numpy")
+    plt = lazy_import("matplotlib.pyplot")
+    sns = lazy_import("seaborn")
 
 with herzog.Cell("markdown"):
     """
@@ -373,6 +406,9 @@ with herzog.Cell("python"):
     #!gsutil cp {html_out} {bucket + html_out}
     pass
 
+with herzog.Cell("python"):
+    print_import_times()
+
 with herzog.Cell("markdown"):
     """
     ### Info
@@ -80,21 +80,52 @@ with herzog.Cell("markdown"):
     ## Import all the packages this notebook will use
 
     """
+# shared-cell: lazy-import
+with herzog.Cell("python"):
+    # Heavy packages are imported on first use, so that notebook startup only pays for the packages used.
+    # `print_import_times()` lists the time spent importing each package.
+    import sys
+    import time
+    import types
+    import importlib
+
+    import_times: dict = dict()
+
+    class LazyModule(types.ModuleType):
+        def _load(self):
+            name = self.__name__
+            if name not in sys.modules:
+                start = time.perf_counter()
+                importlib.import_module(name)
+                import_times[name] = time.perf_counter() - start
+            return sys.modules[name]
+
+        def __getattr__(self, attr):
+            return getattr(self._load(), attr)
+
+        def __setattr__(self, attr, value):
+            setattr(self._load(), attr, value)
+
+    def lazy_import(name):
+        return sys.modules.get(name) or LazyModule(name)
+
+    def print_import_times():
+        for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"{seconds:8.3f}s {name}")
+
 with herzog.Cell("python"):
     #%%capture
-    from firecloud import fiss
-    import pandas as pd
-    pd.set_option('display.max_row', 10)
     import os
     import io
-    import numpy as np
     from pprint import pprint
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-    #%matplotlib inline
-    import time
     from datetime import timedelta
-    import tenacity
+    fiss = lazy_import("firecloud.fiss")
+    pd = lazy_import("pandas")
+    np = lazy_import("numpy")
+    plt = lazy_import("matplotlib.pyplot")
+    sns = lazy_import("seaborn")
+    #%matplotlib inline
+    tenacity = lazy_import("tenacity")
 
 fiss = mock.MagicMock()  # noqa # test fixture
 sns = mock.MagicMock()  # noqa test fixture
@@ -166,6 +197,7 @@ with herzog.Cell("markdown"):
     Here, we use another function in the terra_data_util notebook to use Terra's fiss API to load the consolidate metadata into a pandas dataframe:
     """
 with herzog.Cell("python"):
+    pd.set_option('display.max_row', 10)
     samples = get_terra_table_to_df(PROJECT, WORKSPACE, consolidated_table_name)
     samples
 with herzog.Cell("python"):
@@ -277,3 +309,4 @@ with herzog.Cell("python"):
 with herzog.Cell("python"):
     elapsed_notebook_time = time.time() - start_notebook_time
     print(timedelta(seconds=elapsed_notebook_time))
+    print_import_times()
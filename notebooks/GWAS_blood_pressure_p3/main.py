@@ -103,21 +103,51 @@ with herzog.Cell("markdown"):
 
     """
 
+# shared-cell: lazy-import
+with herzog.Cell("python"):
+    # Heavy packages are imported on first use, so that notebook startup only pays for the packages used.
+    # `print_import_times()` lists the time spent importing each package.
+    import sys
+    import time
+    import types
+    import importlib
+
+    import_times: dict = dict()
+
+    class LazyModule(types.ModuleType):
+        def _load(self):
+            name = self.__name__
+            if name not in sys.modules:
+                start = time.perf_counter()
+                importlib.import_module(name)
+                import_times[name] = time.perf_counter() - start
+            return sys.modules[name]
+
+        def __getattr__(self, attr):
+            return getattr(self._load(), attr)
+
+        def __setattr__(self, attr, value):
+            setattr(self._load(), attr, value)
+
+    def lazy_import(name):
+        return sys.modules.get(name) or LazyModule(name)
+
+    def print_import_times():
+        for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"{seconds:8.3f}s {name}")
+
 with herzog.Cell("python"):
     #%%capture
-    from firecloud import fiss
-    import pandas as pd
-    pd.set_option('display.max_row', 10)
     import os
     import io
-    import numpy as np
     from pprint import pprint
-    import matplotlib.pyplot as plt
-    import seaborn as sns
+    fiss = lazy_import("firecloud.fiss")
+    pd = lazy_import("pandas")
+    np = lazy_import("numpy")
+    plt = lazy_import("matplotlib.pyplot")
+    sns = lazy_import("seaborn")
     #%matplotlib inline
-    import time
-    from datetime import timedelta
-    import tenacity
+    tenacity = lazy_import("tenacity")
 
 fiss = mock.MagicMock()  # noqa # test fixture
 sns = mock.MagicMock()  # noqa test fixture
@@ -129,9 +159,6 @@ with herzog.Cell("markdown"):
 
     ## Define filepaths and environmental variables
     """
-with herzog.Cell("python"):
-    start_notebook_time = time.time()
-
 with herzog.Cell("python"):
     PROJECT = os.environ['GOOGLE_PROJECT']
     WORKSPACE = os.path.basename(os.path.dirname(os.getcwd()))
@@ -140,6 +167,7 @@ with herzog.Cell("python"):
 
 with herzog.Cell("python"):
     # Load phenotypic data from previous notebook
+    pd.set_option('display.max_row', 10)
     samples_traits_for_analysis = pd.read_csv(bucket + 'bp-phenotypes.csv')
 
 with herzog.Cell("markdown"):
@@ -378,12 +406,8 @@ with herzog.Cell("markdown"):
     """
 
 with herzog.Cell("python"):
-    start_matrix_write_time = time.time()
+    #%%time
     mt.write(bucket + 'MyProject_MAFgt0.01.mt', overwrite=True)
-    elapsed_write_time = time.time() - start_matrix_write_time
-
-with herzog.Cell("python"):
-    print(timedelta(seconds=elapsed_write_time))
 
 with herzog.Cell("python"):
     # Read the Hail matrix back in.
@@ -409,18 +433,10 @@ with herzog.Cell("markdown"):
     """
 
 with herzog.Cell("python"):
-    start_vcf_write_time = time.time()
-
-with herzog.Cell("python"):
+    #%%time
     mt = mt.repartition(25)
     hl.export_vcf(mt, bucket + 'MyProject_MAFgt0.01.vcf.bgz', parallel='header_per_shard')
 
-with herzog.Cell("python"):
-    elapsed_vcf_write_time = time.time() - start_vcf_write_time
-
-with herzog.Cell("python"):
-    print(timedelta(seconds=elapsed_vcf_write_time))
-
 with herzog.Cell("markdown"):
     """
     Check that these files were successfully loaded to the bucket:
@@ -472,11 +488,9 @@ with herzog.Cell("markdown"):
     """
 
 with herzog.Cell("python"):
-    #We added code to help you monitor the time it takes for pruning. We currently estimate over an hour.
-    start_prune_write_time = time.time()
+    #%%time
+    # The time it takes for pruning is reported when the cell completes. We currently estimate over an hour.
     pruned_variant_table = hl.ld_prune(mt.GT, r2=0.2, bp_window_size=500000, block_size=1024)
-    elapsed_prune_write_time = time.time() - start_prune_write_time
-    print(timedelta(seconds=elapsed_prune_write_time))
 
 with herzog.Cell("python"):
     mt = mt.filter_rows(hl.is_defined(pruned_variant_table[mt.row_key]))
@@ -547,15 +561,11 @@ with herzog.Cell("markdown"):
     """
 
 with herzog.Cell("python"):
+    #%%time
     # Calculate the GRM
     # WARNING: This can take a very long time to complete!
-    start_grm_time = time.time()
-
     grm = hl.genetic_relatedness_matrix(mt.GT).to_numpy()
 
-    elapsed_grm_time = time.time() - start_grm_time
-    print(timedelta(seconds=elapsed_grm_time))
-
 with herzog.Cell("python"):
     # Get the right sample order
     ind_order = mt.s.collect()
@@ -707,5 +717,4 @@ with herzog.Cell("python"):
     pass
 
 with herzog.Cell("python"):
-    elapsed_notebook_time = time.time() - start_notebook_time
-    print(timedelta(seconds=elapsed_notebook_time))
+    print_import_times()
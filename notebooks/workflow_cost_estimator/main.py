@@ -16,7 +16,7 @@ with herzog.Cell("markdown"):
       - CPUs, Memory, and runtime is pulled from Terra's Firecloud API
         [monitorSubmission](https://api.firecloud.org/#/Submissions/monitorSubmission) endpoint. This information is
         available for 42 days after workflow completion.
-      - GCP Instance type is assumed custom configurations of eith N1 or N2 instance type.
+      - GCP instances are priced as N1 or N2 custom machine types, using list prices for the region of each task.
 
     *author: Brian Hannafious, Genomics Institute, University of California Santa Cruz*
     """
@@ -32,43 +32,491 @@ with herzog.Cell("python"):
 
 with herzog.Cell("markdown"):
     """
-    Define some useful functions.
+    Workflow metadata is cached on the notebook's persistent disk. Metadata for finished workflows is kept
+    permanently, so cost reports can be re-run without API calls, including after Terra expires the metadata.
+    Metadata for in-progress workflows, and submission listings, are refreshed after `ttl` seconds. Delete the cache
+    file to clear the cache.
     """
 
 with herzog.Cell("python"):
-    from terra_notebook_utils import costs, workflows, WORKSPACE_NAME, WORKSPACE_NAMESPACE
+    import os
+    import json
+    import time
+    import zlib
+    import sqlite3
+    import threading
+    from typing import Any, Callable, Optional
+
+    class MetadataCache:
+        def __init__(self, path: str, ttl: float=300):
+            self.path = path
+            self.ttl = ttl
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS metadata "
+                                   "(key TEXT PRIMARY KEY, data BLOB, final INTEGER, fetched REAL)")
+
+        def get(self, key: str, max_age: Optional[float]=None):
+            """Return (value, is_fresh), or None if `key` is not cached. `max_age` overrides the cache TTL."""
+            with self._lock:
+                row = self._conn.execute("SELECT data, final, fetched FROM metadata WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            data, final, fetched = row
+            max_age = self.ttl if max_age is None else max_age
+            return json.loads(zlib.decompress(data)), bool(final) or time.time() - fetched < max_age
+
+        def put(self, key: str, value: Any, final: bool):
+            data = zlib.compress(json.dumps(value).encode("utf-8"))
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                                   (key, data, int(final), time.time()))
+
+        def fetch(self,
+                  key: str,
+                  fetch: Callable[[], Any],
+                  is_final: Callable[[Any], bool],
+                  max_age: Optional[float]=None) -> Any:
+            """Return the cached value for `key`, calling `fetch` if it is missing or expired."""
+            cached = self.get(key, max_age)
+            if cached is not None and cached[1]:
+                return cached[0]
+            try:
+                value = fetch()
+            except Exception:
+                if cached is None:
+                    raise
+                return cached[0]  # An expired copy is better than none
+            self.put(key, value, is_final(value))
+            return value
+
+    metadata_cache = MetadataCache(os.path.join(os.path.expanduser("~"), ".workflow_metadata_cache.sqlite"))
+
+with herzog.Cell("markdown"):
+    """
+    Prices are looked up in an index of per-second rates keyed by region, machine family (N1 or N2 custom),
+    preemptibility, and disk type. Rates for us-central1 N1 machines and standard persistent disks are those used
+    by terra-notebook-utils. Other rates are derived from GCP list prices and regional price ratios. Update
+    `BASE_HOURLY_PRICES`, `BASE_DISK_MONTHLY_PRICES`, and `REGION_PRICE_RATIOS` when prices change.
+    """
+
+with herzog.Cell("python"):
+    from terra_notebook_utils import costs
+
+    DEFAULT_REGION = "us-central1"
+
+    # us-central1 custom machine prices, USD per hour: (family, preemptible) -> (cpu, memory GB)
+    BASE_HOURLY_PRICES = {
+        ("n1", False): (costs.GCPCustomN1Cost.estimate(1, 0, 3600, False),
+                        costs.GCPCustomN1Cost.estimate(0, 1, 3600, False)),
+        ("n1", True): (costs.GCPCustomN1Cost.estimate(1, 0, 3600, True),
+                       costs.GCPCustomN1Cost.estimate(0, 1, 3600, True)),
+        ("n2", False): (0.033174, 0.004446),
+        ("n2", True): (0.00802, 0.00108),
+    }
+
+    # us-central1 disk prices, USD per GB month
+    BASE_DISK_MONTHLY_PRICES = {"pd-standard": 0.04, "pd-balanced": 0.10, "pd-ssd": 0.17, "local-ssd": 0.08}
+
+    # Regional prices relative to us-central1: (compute, disk)
+    REGION_PRICE_RATIOS = {
+        "us-central1": (1.0, 1.0),
+        "us-east1": (1.0, 1.0),
+        "us-west1": (1.0, 1.0),
+        "us-east4": (1.1264, 1.1),
+        "us-west2": (1.2009, 1.2),
+        "us-west3": (1.2009, 1.2),
+        "us-west4": (1.1264, 1.1),
+        "northamerica-northeast1": (1.1, 1.1),
+        "europe-west1": (1.1, 1.0),
+        "europe-west2": (1.2879, 1.2),
+        "europe-west3": (1.2879, 1.2),
+        "europe-west4": (1.1, 1.1),
+        "asia-east1": (1.1581, 1.0),
+        "asia-northeast1": (1.2847, 1.3),
+        "australia-southeast1": (1.4127, 1.35),
+    }
+
+    # Per-second rates: (region, family, preemptible) -> (cpu, memory GB), and (region, disk_type) -> GB
+    MACHINE_PRICE_INDEX = {
+        (region, family, preemptible): (cpu * compute_ratio / 3600, memory * compute_ratio / 3600)
+        for region, (compute_ratio, _) in REGION_PRICE_RATIOS.items()
+        for (family, preemptible), (cpu, memory) in BASE_HOURLY_PRICES.items()
+    }
+    DISK_PRICE_INDEX = {
+        (region, disk_type): (costs.PersistentDisk.estimate(1, 1) * monthly_price / BASE_DISK_MONTHLY_PRICES['pd-standard']
+                              * disk_ratio)
+        for region, (_, disk_ratio) in REGION_PRICE_RATIOS.items()
+        for disk_type, monthly_price in BASE_DISK_MONTHLY_PRICES.items()
+    }
+
+    _unpriced_regions: set = set()
+
+    def priced_region(region: str) -> str:
+        if region in REGION_PRICE_RATIOS:
+            return region
+        if region not in _unpriced_regions:
+            _unpriced_regions.add(region)
+            print(f"No prices for region '{region}', using {DEFAULT_REGION} prices.")
+        return DEFAULT_REGION
+
+    def machine_rates(region: str, family: str, preemptible: bool):
+        """Per-second (cpu, memory GB) rates."""
+        return MACHINE_PRICE_INDEX[(priced_region(region), family, preemptible)]
+
+    def disk_rate(region: str, disk_type: str) -> float:
+        """Per-second GB rate."""
+        return DISK_PRICE_INDEX[(priced_region(region), disk_type)]
+
+with herzog.Cell("markdown"):
+    """
+    Define some useful functions. Workflow metadata is fetched concurrently; pass `max_workers` to
+    `cost_for_submission` to change the number of concurrent requests. Metadata responses are parsed incrementally
+    as they arrive, keeping only the fields used for cost estimates, so very large scattered workflows fit in memory.
+    """
+
+with herzog.Cell("python"):
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from typing import Any, Dict, Iterable, List, Optional, Tuple
+    import re
+    import datetime
+    import ijson
+    from firecloud import fiss
+    from terra_notebook_utils import workflows, WORKSPACE_NAME, WORKSPACE_NAMESPACE
+
+    # Submission listing fields that are kept
+    SUBMISSION_FIELDS = ("submissionId", "submissionDate", "status", "methodConfigurationName")
+
+    def fetch_submissions(workspace: str=WORKSPACE_NAME, workspace_namespace: str=WORKSPACE_NAMESPACE) -> List[dict]:
+        """Stream the submission listing of a workspace, keeping only `SUBMISSION_FIELDS` of each submission."""
+        # `fapi.list_submissions` reads the entire response body, so the private `fapi.__get` is used to stream it.
+        # Private firecloud functions may change in any release, which is why firecloud is pinned in requirements.txt.
+        with fiss.fapi.__get(f"workspaces/{workspace_namespace}/{workspace}/submissions", stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            return [{key: s[key] for key in SUBMISSION_FIELDS if key in s} for s in ijson.items(resp.raw, "item")]
 
     def list_submissions_chronological(workspace: str=WORKSPACE_NAME,
-                                       workspace_namespace: str=WORKSPACE_NAMESPACE):
-        listing = [(s['submissionDate'], s) for s in workflows.list_submissions(workspace, workspace_namespace)]
-        for date, submission in sorted(listing):
-            yield submission
+                                       workspace_namespace: str=WORKSPACE_NAMESPACE,
+                                       start: Optional[str]=None,
+                                       end: Optional[str]=None):
+        """
+        Yield submissions in chronological order. If provided, `start` and `end` limit submission dates to the
+        interval [start, end). Dates are ISO 8601 strings or prefixes, e.g. "2021-03" or "2021-03-15".
+        """
+        submissions = metadata_cache.fetch(f"submissions/{workspace_namespace}/{workspace}",
+                                           lambda: fetch_submissions(workspace, workspace_namespace),
+                                           lambda _: False)
+        listing = [s for s in submissions
+                   if (start is None or start <= s['submissionDate']) and (end is None or s['submissionDate'] < end)]
+        yield from sorted(listing, key=lambda s: s['submissionDate'])
+
+    FINAL_WORKFLOW_STATUSES = {"Succeeded", "Failed", "Aborted"}
+    FINAL_SUBMISSION_STATUSES = {"Done", "Aborted"}
+
+    def subworkflow_calls(workflow_metadata: dict) -> List[Tuple[str, str]]:
+        """Return (call name, subworkflow id) for each subworkflow call, including each shard of scattered calls."""
+        return [(call_name.split(".", 1)[-1], call_metadata['subWorkflowId'])
+                for call_name, call_metadata_list in workflow_metadata.get('calls', dict()).items()
+                for call_metadata in call_metadata_list
+                if "subWorkflowId" in call_metadata]
+
+    def subworkflow_ids(workflow_metadata: dict) -> list:
+        return [subworkflow_id for _, subworkflow_id in subworkflow_calls(workflow_metadata)]
+
+    # Metadata fields used for cost estimates. Nested fields map to the subfields that are kept.
+    WORKFLOW_METADATA_FIELDS = ("id", "status")
+    CALL_METADATA_FIELDS: Dict[str, Optional[Tuple[str, ...]]] = {
+        "start": None, "end": None, "attempt": None, "shardIndex": None, "executionStatus": None,
+        "preemptible": None, "subWorkflowId": None, "jes": ("machineType", "zone"),
+        "runtimeAttributes": ("preemptible", "disks"), "callCaching": ("hit",),
+    }
+    # Large metadata fields that are never used, omitted by the server
+    EXCLUDED_METADATA_KEYS = ["inputs", "outputs", "executionEvents", "commandLine", "submittedFiles", "backendLogs",
+                              "labels", "workflowProcessingEvents"]
+
+    def iter_workflow_metadata(stream) -> Iterable[Tuple[str, str, Any]]:
+        """
+        Incrementally parse workflow metadata JSON from the file-like `stream`. Yield ("workflow", key, value) for
+        top level fields in `WORKFLOW_METADATA_FIELDS`, and ("call", call_name, call_metadata) for each call as soon
+        as it is parsed. Call metadata is projected to `CALL_METADATA_FIELDS`, and other fields are skipped without
+        being built.
+        """
+        events = iter(ijson.basic_parse(stream, use_float=True))
+
+        def read_value(first_event: Tuple[str, Any], keep: bool=True) -> Any:
+            event, value = first_event
+            if event not in ("start_map", "start_array"):
+                return value
+            builder = ijson.ObjectBuilder() if keep else None
+            depth = 0
+            while True:
+                if builder is not None:
+                    builder.event(event, value)
+                depth += (event in ("start_map", "start_array")) - (event in ("end_map", "end_array"))
+                if 0 == depth:
+                    return builder.value if builder is not None else None
+                event, value = next(events)
+
+        def read_call() -> dict:
+            call_metadata: dict = dict()
+            for event, key in events:
+                if "end_map" == event:
+                    return call_metadata
+                if key in CALL_METADATA_FIELDS:
+                    value = read_value(next(events))
+                    subfields = CALL_METADATA_FIELDS[key]
+                    if subfields is not None and isinstance(value, dict):
+                        value = {k: v for k, v in value.items() if k in subfields}
+                    call_metadata[key] = value
+                else:
+                    read_value(next(events), keep=False)
+            raise ValueError("Truncated workflow metadata")
+
+        next(events)  # start_map
+        for event, key in events:
+            if "end_map" == event:
+                return
+            elif "calls" == key and "start_map" == next(events)[0]:
+                for event, call_name in events:
+                    if "end_map" == event:
+                        break
+                    next(events)  # start_array
+                    for event, _ in events:
+                        if "end_array" == event:
+                            break
+                        yield "call", call_name, read_call()
+            elif key in WORKFLOW_METADATA_FIELDS:
+                yield "workflow", key, read_value(next(events))
+            else:
+                read_value(next(events), keep=False)
+
+    def fetch_workflow_metadata(submission_id: str,
+                                workflow_id: str,
+                                workspace: str=WORKSPACE_NAME,
+                                workspace_namespace: str=WORKSPACE_NAMESPACE) -> dict:
+        """
+        Stream metadata for a workflow from the Firecloud API, keeping only the fields needed for cost estimates. The
+        full response is never materialized.
+        """
+        uri = f"workspaces/{workspace_namespace}/{workspace}/submissions/{submission_id}/workflows/{workflow_id}"
+        workflow_metadata: dict = dict(calls=dict())
+        # `fapi.get_workflow_metadata` reads the entire response body; see `fetch_submissions` on the use of `fapi.__get`
+        with fiss.fapi.__get(uri, params=dict(excludeKey=EXCLUDED_METADATA_KEYS), stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            for kind, key, value in iter_workflow_metadata(resp.raw):
+                if "call" == kind:
+                    workflow_metadata['calls'].setdefault(key, list()).append(value)
+                else:
+                    workflow_metadata[key] = value
+        return workflow_metadata
+
+    def get_workflows_metadata(submission_id: str,
+                               workflow_ids: Iterable[str],
+                               workspace: str=WORKSPACE_NAME,
+                               workspace_namespace: str=WORKSPACE_NAMESPACE,
+                               max_workers: int=16,
+                               max_age: Optional[float]=None) -> Iterable[Tuple[str, Optional[dict]]]:
+        """
+        Fetch metadata for workflows, and their subworkflows, with up to `max_workers` concurrent requests.
+        Workflows are yielded in the order given, each followed by its subworkflows. Metadata is None for workflows
+        that could not be retrieved. Cached metadata of unfinished workflows older than `max_age` is refetched.
+        """
+        futures: Dict[str, Future] = dict()
+
+        def fetch(workflow_id: str) -> Optional[dict]:
+            try:
+                workflow_metadata = metadata_cache.fetch(
+                    f"workflow/{workspace_namespace}/{workspace}/{submission_id}/{workflow_id}",
+                    lambda: fetch_workflow_metadata(submission_id, workflow_id, workspace, workspace_namespace),
+                    lambda md: md['status'] in FINAL_WORKFLOW_STATUSES,
+                    max_age
+                )
+            except Exception as e:
+                print(f"Unable to retrieve metadata for workflow {workflow_id}: {e}")
+                return None
+            for subworkflow_id in subworkflow_ids(workflow_metadata):
+                futures[subworkflow_id] = executor.submit(fetch, subworkflow_id)
+            return workflow_metadata
+
+        def walk(workflow_ids: Iterable[str]):
+            for workflow_id in workflow_ids:
+                workflow_metadata = futures[workflow_id].result()
+                yield workflow_id, workflow_metadata
+                if workflow_metadata is not None:
+                    yield from walk(subworkflow_ids(workflow_metadata))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            workflow_ids = list(workflow_ids)
+            for workflow_id in workflow_ids:
+                futures[workflow_id] = executor.submit(fetch, workflow_id)
+            yield from walk(workflow_ids)
+
+    # Memory per cpu of predefined machine types, in GB
+    PREDEFINED_MEMORY_PER_CPU = {("n1", "standard"): 3.75, ("n1", "highmem"): 6.5, ("n1", "highcpu"): 0.9,
+                                 ("n2", "standard"): 4, ("n2", "highmem"): 8, ("n2", "highcpu"): 1}
+    DISK_TYPES = {"HDD": "pd-standard", "SSD": "pd-ssd", "LOCAL": "local-ssd"}
+
+    def parse_machine_type(machine_type: str) -> Tuple[str, int, float]:
+        """
+        Return family, cpus, and memory in GB for custom machine types, e.g. "custom-4-16384" or
+        "n2-custom-4-16384", or predefined machine types, e.g. "n1-standard-4". Predefined machine types are priced
+        as custom machine types.
+        """
+        m = re.fullmatch(r"(?:(\w+)-)?custom-(\d+)-(\d+)(?:-ext)?", machine_type)
+        if m:
+            return (m.group(1) or "n1"), int(m.group(2)), int(m.group(3)) / 1024
+        family, kind, cpus = machine_type.split("-")
+        return family, int(cpus), int(cpus) * PREDEFINED_MEMORY_PER_CPU[(family, kind)]
+
+    def parse_disks(disks: str) -> Dict[str, float]:
+        """Return disk size in GB by disk type for Cromwell disk runtime attributes, e.g. "local-disk 100 HDD"."""
+        sizes: Dict[str, float] = dict()
+        for disk in disks.split(","):
+            _, size_gb, disk_type = disk.split()
+            sizes[DISK_TYPES[disk_type]] = sizes.get(DISK_TYPES[disk_type], 0) + float(size_gb)
+        return sizes
+
+    def parse_timestamp(timestamp: str) -> datetime.datetime:
+        return datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+    def estimate_call_cost(call_name: str, call_metadata: dict) -> Optional[dict]:
+        """Estimate the cost of a task call from its Cromwell metadata. Return None for calls that have not started."""
+        if "start" not in call_metadata or "machineType" not in call_metadata.get('jes', dict()):
+            return None
+        family, cpus, memory_gb = parse_machine_type(call_metadata['jes']['machineType'])
+        zone = call_metadata['jes'].get('zone')
+        region = zone.rsplit("-", 1)[0] if zone else DEFAULT_REGION
+        runtime_attributes = call_metadata.get('runtimeAttributes', dict())
+        if "preemptible" in call_metadata:
+            preemptible = bool(call_metadata['preemptible'])
+        else:
+            preemptible = call_metadata.get('attempt', 1) <= int(runtime_attributes.get('preemptible', 0))
+        disks = parse_disks(runtime_attributes.get('disks', "local-disk 0 HDD"))
+        start = parse_timestamp(call_metadata['start'])
+        if "end" in call_metadata:
+            end = parse_timestamp(call_metadata['end'])
+        else:
+            end = datetime.datetime.now(datetime.timezone.utc)
+        duration = (end - start).total_seconds()
+        call_cached = bool(call_metadata.get('callCaching', dict()).get('hit', False))
+        if call_cached:
+            cost = 0.0
+        else:
+            cpu_rate, memory_rate = machine_rates(region, family, preemptible)
+            disk_cost_rate = sum(size_gb * disk_rate(region, disk_type) for disk_type, size_gb in disks.items())
+            cost = duration * (cpus * cpu_rate + memory_gb * memory_rate + disk_cost_rate)
+        return dict(task_name=call_name.split(".", 1)[-1],
+                    cost=cost,
+                    number_of_cpus=cpus,
+                    memory=memory_gb,
+                    disk=sum(disks.values()),
+                    duration=duration,
+                    call_cached=call_cached,
+                    region=region,
+                    machine_family=family,
+                    preemptible=preemptible,
+                    disk_type=max(disks, key=disks.get) if disks else "pd-standard",
+                    attempt=call_metadata.get('attempt', 1),
+                    shard_index=call_metadata.get('shardIndex', -1),
+                    execution_status=call_metadata.get('executionStatus'))
+
+    def estimate_workflow_cost(workflow_id: str, workflow_metadata: dict):
+        """Yield cost estimates for each task call of a workflow, excluding calls to subworkflows."""
+        for call_name, call_metadata_list in workflow_metadata.get('calls', dict()).items():
+            for call_metadata in call_metadata_list:
+                if "subWorkflowId" not in call_metadata:
+                    try:
+                        call_cost = estimate_call_cost(call_name, call_metadata)
+                    except (KeyError, ValueError) as e:
+                        print(f"Unable to estimate cost for {call_name} in workflow {workflow_id}: {e!r}")
+                        continue
+                    if call_cost is not None:
+                        yield call_cost
 
     def cost_for_submission(submission_id: str,
                             workspace: str=WORKSPACE_NAME,
-                            workspace_namespace: str=WORKSPACE_NAMESPACE):
+                            workspace_namespace: str=WORKSPACE_NAMESPACE,
+                            max_workers: int=16):
         try:
-            workflows_metadata = workflows.get_all_workflows(submission_id, workspace, workspace_namespace)
-        except:
+            submission = metadata_cache.fetch(
+                f"submission/{workspace_namespace}/{workspace}/{submission_id}",
+                lambda: workflows.get_submission(submission_id, workspace, workspace_namespace),
+                lambda sub: sub['status'] in FINAL_SUBMISSION_STATUSES
+            )
+        except Exception:
             print("Unable to retrieve workflow metadata for specified submission.")
             return
-        for workflow_id, workflow_metadata in workflows_metadata.items():
+        workflow_ids = [wf['workflowId'] for wf in submission['workflows'] if "workflowId" in wf]
+        if not workflow_ids:
+            print("No workflow IDs found, submission has status failed.")
+        workflows_metadata = get_workflows_metadata(submission_id, workflow_ids, workspace, workspace_namespace,
+                                                    max_workers)
+        # Subworkflow calls leading to each workflow, e.g. "joint_genotyping/merge_shards/"
+        call_paths = {workflow_id: "" for workflow_id in workflow_ids}
+        for workflow_id, workflow_metadata in workflows_metadata:
+            if workflow_metadata is None:
+                continue
+            for call_name, subworkflow_id in subworkflow_calls(workflow_metadata):
+                call_paths[subworkflow_id] = f"{call_paths[workflow_id]}{call_name}/"
             if "Submitted" == workflow_metadata['status']:
                 print("Workflow has submitted status, cost estimates may be unavailable.")
             elif "Failed" == workflow_metadata['status']:
                 print("No workflow IDs found, submission has status failed.")
             else:
                 shard_number = 1  # keep track of scattered workflows
-                for shard_info in workflows.estimate_workflow_cost(workflow_id, workflow_metadata):
+                for shard_info in estimate_workflow_cost(workflow_id, workflow_metadata):
                     shard_info['workflow_id'] = workflow_id
+                    shard_info['call_path'] = call_paths[workflow_id] + shard_info['task_name']
                     shard_info['shard'] = shard_number
                     shard_number += 1
                     yield shard_info
 
-    def estimate_job_cost(cpus: int, memory_gb: int, disk_gb: int, runtime_hours: float, preemptible: bool) -> float:
-        disk = costs.PersistentDisk.estimate(disk_gb, runtime_hours * 3600)
-        compute = costs.GCPCustomN1Cost.estimate(cpus, memory_gb, runtime_hours * 3600, preemptible)
-        return disk + compute
+    def estimate_job_cost(cpus: int,
+                          memory_gb: int,
+                          disk_gb: int,
+                          runtime_hours: float,
+                          preemptible: bool,
+                          region: str=DEFAULT_REGION,
+                          family: str="n1",
+                          disk_type: str="pd-standard") -> float:
+        cpu_rate, memory_rate = machine_rates(region, family, preemptible)
+        rate = cpus * cpu_rate + memory_gb * memory_rate + disk_gb * disk_rate(region, disk_type)
+        return runtime_hours * 3600 * rate
+
+with herzog.Cell("markdown"):
+    """
+    `estimate_job_costs` estimates the cost of many configurations in one vectorized pass. Arguments may be scalars
+    or NumPy arrays, and `family` selects N1 or N2 custom machine types.
+    """
+
+with herzog.Cell("python"):
+    import numpy as np
+
+    def estimate_job_costs(cpus,
+                           memory_gb,
+                           disk_gb,
+                           runtime_hours,
+                           preemptible,
+                           region: str=DEFAULT_REGION,
+                           family="n1",
+                           disk_type: str="pd-standard") -> np.ndarray:
+        cpus, memory_gb, disk_gb, runtime_hours = (np.asarray(a, dtype=float)
+                                                   for a in (cpus, memory_gb, disk_gb, runtime_hours))
+        preemptible = np.asarray(preemptible, dtype=bool)
+        family = np.asarray(family)
+        cpu_rate = np.zeros(family.shape)
+        memory_rate = np.zeros(family.shape)
+        for fam in np.unique(family):
+            cpu, memory = machine_rates(region, str(fam).lower(), False)
+            preemptible_cpu, preemptible_memory = machine_rates(region, str(fam).lower(), True)
+            is_family = family == fam
+            cpu_rate = np.where(is_family, np.where(preemptible, preemptible_cpu, cpu), cpu_rate)
+            memory_rate = np.where(is_family, np.where(preemptible, preemptible_memory, memory), memory_rate)
+        rate = cpus * cpu_rate + memory_gb * memory_rate + disk_gb * disk_rate(region, disk_type)
+        return runtime_hours * 3600 * rate
 
 with herzog.Cell("markdown"):
     """
@@ -92,27 +540,392 @@ with herzog.Cell("markdown"):
     Terra's ability to detect invalid inputs tends to be fast, so it is unlikely for cases 2 and 3 overlap.
     """
 
+with herzog.Cell("python"):
+    import csv
+    from collections import defaultdict
+
+    class ShardTable:
+        """Shard cost estimates stored by column. Iterating yields one dict per shard."""
+        def __init__(self, shards: Iterable[dict]):
+            columns: Dict[str, list] = defaultdict(list)
+            for shard_info in shards:
+                for key, value in shard_info.items():
+                    columns[key].append(value)
+            self.columns = {key: np.array(values) for key, values in columns.items()}
+
+        def __len__(self):
+            return len(self.columns.get('cost', ()))
+
+        def __iter__(self):
+            keys = list(self.columns)
+            for values in zip(*(self.columns[k].tolist() for k in keys)):
+                yield dict(zip(keys, values))
+
+        @property
+        def total_cost(self) -> float:
+            return float(self.columns['cost'].sum()) if len(self) else 0.0
+
+        def render(self, page: int=0, page_size: int=50) -> str:
+            """Render one page of shards as a table."""
+            header = ("workflow_id", "task_name", "cpus", "memory", "disk", "duration", "cost")
+            lines = ["%37s %30s %5s %7s %7s %9s %7s" % header]
+            start, end = page * page_size, min((page + 1) * page_size, len(self))
+            rows = zip(*(self.columns.get(k, np.empty(0))[start:end].tolist()
+                         for k in ("workflow_id", "task_name", "number_of_cpus", "memory", "disk", "duration", "cost")))
+            lines.extend("%37s %30s %5i %5iGB %5iGB %8.2fh %7s" % (workflow_id, task_name, cpus, memory, disk,
+                                                                   duration / 3600, "$%.2f" % cost)
+                         for workflow_id, task_name, cpus, memory, disk, duration, cost in rows)
+            if end < len(self):
+                lines.append(f"shards {start + 1}-{end} of {len(self)}, render(page={page + 1}) for more")
+            lines.append("%108s" % ("total_cost: $%.2f" % round(self.total_cost, 2)))
+            return "\n".join(lines)
+
+        def task_totals(self) -> Dict[str, dict]:
+            """Shard count, total cost, and total duration in hours for each task."""
+            if not len(self):
+                return dict()
+            tasks, task_index = np.unique(self.columns['task_name'], return_inverse=True)
+            counts = np.bincount(task_index)
+            costs = np.bincount(task_index, weights=self.columns['cost'])
+            hours = np.bincount(task_index, weights=self.columns['duration']) / 3600
+            return {str(t): dict(shards=int(n), cost=float(c), hours=float(h))
+                    for t, n, c, h in zip(tasks, counts, costs, hours)}
+
+        def task_summary(self, percentiles=(50, 90, 99)) -> Dict[str, dict]:
+            """Shard count, total and mean cost, and percentiles of duration in hours and cost, for each task."""
+            if not len(self):
+                return dict()
+            tasks, task_index = np.unique(self.columns['task_name'], return_inverse=True)
+            counts = np.bincount(task_index)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            summary: Dict[str, dict] = {str(t): dict(shards=int(n)) for t, n in zip(tasks, counts)}
+            for column, values in (("duration", self.columns['duration'] / 3600), ("cost", self.columns['cost'])):
+                # Sort values within each task, then interpolate percentiles at per-task offsets
+                ordered = values[np.lexsort((values, task_index))]
+                for q in percentiles:
+                    position = starts + (counts - 1) * q / 100
+                    lower, upper = np.floor(position).astype(int), np.ceil(position).astype(int)
+                    p = ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+                    for t, v in zip(tasks, p):
+                        summary[str(t)][f"{column}_p{q}"] = float(v)
+            total_cost = np.bincount(task_index, weights=self.columns['cost'])
+            for t, total, n in zip(tasks, total_cost, counts):
+                summary[str(t)].update(total_cost=float(total), mean_cost=float(total / n))
+            return summary
+
+        def outliers(self, straggler_factor: float=3.0) -> List[dict]:
+            """
+            Shards that ran more than `straggler_factor` times longer than their task's median duration, and
+            preempted or retried attempts.
+            """
+            if not len(self):
+                return list()
+            c = self.columns
+            tasks, task_index = np.unique(c['task_name'], return_inverse=True)
+            summary = self.task_summary((50,))
+            medians = np.array([summary[str(t)]['duration_p50'] for t in tasks]) * 3600
+            not_cached = ~c['call_cached'].astype(bool)
+            straggler = not_cached & (c['duration'] > straggler_factor * medians[task_index])
+            retry = np.zeros(len(self), dtype=bool)
+            if "attempt" in c:
+                retry |= c['attempt'] > 1
+            if "execution_status" in c:
+                retry |= c['execution_status'] == "RetryableFailure"
+            shards = list(self)
+            return [dict(shards[i], outlier="straggler" if straggler[i] else "retry")
+                    for i in np.flatnonzero(straggler | retry)]
+
+        def render_task_summary(self) -> str:
+            header = ("task_name", "shards", "total", "mean", "p50_time", "p90_time", "p99_time",
+                      "p50_cost", "p90_cost", "p99_cost")
+            lines = ["%30s %7s %10s %9s %9s %9s %9s %9s %9s %9s" % header]
+            summary = sorted(self.task_summary().items(), key=lambda item: item[1]['total_cost'], reverse=True)
+            for task_name, t in summary:
+                lines.append("%30s %7i %10s %9s %8.2fh %8.2fh %8.2fh %9s %9s %9s" % (
+                    task_name, t['shards'], "$%.2f" % t['total_cost'], "$%.3f" % t['mean_cost'],
+                    t['duration_p50'], t['duration_p90'], t['duration_p99'],
+                    "$%.3f" % t['cost_p50'], "$%.3f" % t['cost_p90'], "$%.3f" % t['cost_p99']
+                ))
+            return "\n".join(lines)
+
+        def render_task_totals(self) -> str:
+            lines = ["%30s %8s %10s %10s" % ("task_name", "shards", "hours", "cost")]
+            for task_name, t in sorted(self.task_totals().items(), key=lambda item: item[1]['cost'], reverse=True):
+                lines.append("%30s %8i %9.2fh %10s" % (task_name, t['shards'], t['hours'], "$%.2f" % t['cost']))
+            return "\n".join(lines)
+
+        def call_tree_costs(self) -> Dict[str, Tuple[int, float]]:
+            """
+            Shard count and total cost of each task and subworkflow call, keyed by call path, e.g. "sub/task".
+            Subworkflow costs include every call they contain, and shards of scattered calls are combined.
+            """
+            if not len(self):
+                return dict()
+            paths, path_index = np.unique(self.columns['call_path'], return_inverse=True)
+            shard_counts = np.bincount(path_index)
+            path_costs = np.bincount(path_index, weights=self.columns['cost'])
+            tree: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+            for path, n, cost in zip(paths.tolist(), shard_counts, path_costs):
+                parts = path.split("/")
+                for depth in range(1, len(parts) + 1):
+                    node = tree["/".join(parts[:depth])]
+                    node[0] += int(n)
+                    node[1] += float(cost)
+            return {path: (n, cost) for path, (n, cost) in sorted(tree.items(), key=lambda item: item[0].split("/"))}
+
+        def render_call_tree(self) -> str:
+            lines = ["%-50s %8s %10s" % ("call", "shards", "cost")]
+            for path, (n, cost) in self.call_tree_costs().items():
+                parts = path.split("/")
+                lines.append("%-50s %8i %10s" % ("  " * (len(parts) - 1) + parts[-1], n, "$%.2f" % cost))
+            return "\n".join(lines)
+
+        def export(self, path: str):
+            """Write all shards to a CSV file."""
+            keys = list(self.columns)
+            with open(path, "w", newline="") as fh:
+                writer = csv.writer(fh)
+                writer.writerow(keys)
+                writer.writerows(zip(*(self.columns[k].tolist() for k in keys)))
+
 with herzog.Cell("python"):
     # submission_id = "388beeb8-5e44-4215-8a71-89f2625fbc45"  # Uncomment and insert your submission id here
-    total_cost = 0
-    print("%37s" % "workflow_id",
-          "%30s" % "task_name",
-          "%5s" % "cpus",
-          "%7s" % "memory",
-          "%7s" % "disk",
-          "%9s" % "duration",
-          "%7s" % "cost")
-    for shard_info in cost_for_submission(submission_id):
-        total_cost += shard_info['cost']
-        print("%37s" % shard_info['workflow_id'],
-              "%30s" % shard_info['task_name'],
-              "%5i" % shard_info['number_of_cpus'],
-              "%5iGB" % shard_info['memory'],
-              "%5iGB" % shard_info['disk'],
-              "%8.2fh" % (shard_info['duration'] / 3600),  # convert from seconds to hours
-              "%7s" % ("$%.2f" % shard_info['cost']))
-        shard_info['duration'] /= 3600  # convert from seconds to hours
-    print("%108s" % ("total_cost: $%.2f" % round(total_cost, 2)))
+    shards = ShardTable(cost_for_submission(submission_id))
+    print(shards.render())
+    print()
+    print(shards.render_task_totals())
+    # shards.export("shards.csv")  # Uncomment to write every shard to a CSV file
+
+with herzog.Cell("markdown"):
+    """
+    Summarize shard duration and cost for each task, and list outlier shards: stragglers running more than three
+    times longer than their task's median, and preempted or retried attempts.
+    """
+
+with herzog.Cell("python"):
+    print(shards.render_task_summary())
+    print()
+    outliers = shards.outliers()
+    header = ("workflow_id", "task_name", "shard", "attempt", "duration", "cost", "outlier")
+    print("%37s %30s %7s %8s %9s %7s %10s" % header)
+    for o in outliers[:20]:
+        row = (o['workflow_id'], o['task_name'], o['shard_index'], o['attempt'], o['duration'] / 3600,
+               "$%.2f" % o['cost'], o['outlier'])
+        print("%37s %30s %7i %8i %8.2fh %7s %10s" % row)
+    if 20 < len(outliers):
+        print(f"{len(outliers) - 20} more outliers")
+
+with herzog.Cell("markdown"):
+    """
+    Show the cost of each task and subworkflow call, combined across workflows. Subworkflow metadata is fetched
+    concurrently as subworkflows are discovered, and the cost of each subworkflow includes all of the calls it
+    contains, including nested subworkflows.
+    """
+
+with herzog.Cell("python"):
+    print(shards.render_call_tree())
+
+with herzog.Cell("markdown"):
+    """
+    Watch the cost of an in-progress submission. Each poll fetches the submission's workflow statuses, and only
+    refetches metadata for workflows whose status changed, or running workflows not refetched for
+    `running_refresh` seconds. The running total is updated with the change in cost of refetched workflows.
+    Watching stops when the submission finishes, or after `timeout` seconds.
+    """
+
+with herzog.Cell("python"):
+    class SubmissionWatcher:
+        def __init__(self,
+                     submission_id: str,
+                     workspace: str=WORKSPACE_NAME,
+                     workspace_namespace: str=WORKSPACE_NAMESPACE,
+                     max_workers: int=16,
+                     running_refresh: float=600):
+            self.submission_id = submission_id
+            self.workspace = workspace
+            self.workspace_namespace = workspace_namespace
+            self.max_workers = max_workers
+            self.running_refresh = running_refresh
+            self.submission_status: Optional[str] = None
+            self.total_cost = 0.0
+            self.workflow_status: Dict[str, str] = dict()
+            self.workflow_cost: Dict[str, float] = dict()
+            self.workflow_shards: Dict[str, set] = dict()
+            self._last_fetched: Dict[str, float] = dict()
+
+        def _needs_refresh(self, workflow_id: str, status: str, now: float) -> bool:
+            if status != self.workflow_status.get(workflow_id):
+                return True
+            is_running = status not in FINAL_WORKFLOW_STATUSES
+            return is_running and now - self._last_fetched.get(workflow_id, 0) >= self.running_refresh
+
+        def poll(self) -> Tuple[float, int]:
+            """Refresh changed workflows. Return the change in total cost, and the number of new shards."""
+            submission = metadata_cache.fetch(
+                f"submission/{self.workspace_namespace}/{self.workspace}/{self.submission_id}",
+                lambda: workflows.get_submission(self.submission_id, self.workspace, self.workspace_namespace),
+                lambda sub: sub['status'] in FINAL_SUBMISSION_STATUSES,
+                max_age=0
+            )
+            now = time.time()
+            statuses = {wf['workflowId']: wf['status'] for wf in submission['workflows'] if "workflowId" in wf}
+            stale = [wf_id for wf_id, status in statuses.items() if self._needs_refresh(wf_id, status, now)]
+            delta, new_shards = 0.0, 0
+            workflows_metadata = get_workflows_metadata(self.submission_id, stale, self.workspace,
+                                                        self.workspace_namespace, self.max_workers, max_age=0)
+            for workflow_id, workflow_metadata in workflows_metadata:
+                if workflow_metadata is None:
+                    continue
+                shards: set = set()
+                cost = 0.0
+                task_counts: Dict[str, int] = defaultdict(int)
+                for shard_info in estimate_workflow_cost(workflow_id, workflow_metadata):
+                    task_counts[shard_info['task_name']] += 1
+                    shards.add((shard_info['task_name'], task_counts[shard_info['task_name']]))
+                    cost += shard_info['cost']
+                new_shards += len(shards - self.workflow_shards.get(workflow_id, set()))
+                delta += cost - self.workflow_cost.get(workflow_id, 0.0)
+                self.workflow_shards[workflow_id] = shards
+                self.workflow_cost[workflow_id] = cost
+                self._last_fetched[workflow_id] = now
+            self.workflow_status.update(statuses)
+            self.submission_status = submission['status']
+            self.total_cost += delta
+            return delta, new_shards
+
+        def watch(self, interval: float=60, timeout: Optional[float]=None):
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                delta, new_shards = self.poll()
+                print(time.strftime("%H:%M:%S"),
+                      "%10s" % self.submission_status,
+                      "%10s" % ("$%.2f" % self.total_cost),
+                      "%10s" % ("+$%.2f" % delta),
+                      "%6i new shards" % new_shards)
+                if self.submission_status in FINAL_SUBMISSION_STATUSES:
+                    break
+                if deadline is not None and deadline <= time.time() + interval:
+                    print(f"Stopped watching after {timeout:.0f}s")
+                    break
+                time.sleep(interval)
+
+with herzog.Cell("python"):
+    SubmissionWatcher(submission_id).watch(timeout=30 * 60)
+
+with herzog.Cell("markdown"):
+    """
+    Estimate costs for every submission in the workspace within a date range. One row per shard is written to a
+    CSV file, or Parquet file if the path ends with ".parquet", as submissions are costed. Total costs are aggregated
+    by submission, method configuration, task, and submission day.
+    """
+
+with herzog.Cell("python"):
+    from collections import deque
+    from itertools import islice
+    from typing import Deque
+
+    REPORT_FIELDS = ["submission_id", "submission_date", "method_configuration", "workflow_id", "task_name", "shard",
+                     "number_of_cpus", "memory", "disk", "duration", "call_cached", "cost"]
+
+    class ShardWriter:
+        def __init__(self, path: str, batch_size: int=10000):
+            self.path = path
+            self.batch_size = batch_size
+            self._rows: list = list()
+            self._parquet_writer = None
+            if path.endswith(".parquet"):
+                import pyarrow
+                import pyarrow.parquet
+                self._pyarrow = pyarrow
+                self._parquet = pyarrow.parquet
+            else:
+                self._fh = open(path, "w", newline="")
+                self._csv_writer = csv.DictWriter(self._fh, REPORT_FIELDS, extrasaction="ignore")
+                self._csv_writer.writeheader()
+
+        def write(self, row: dict):
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                self.flush()
+
+        def flush(self):
+            if self.path.endswith(".parquet"):
+                if self._rows:
+                    table = self._pyarrow.Table.from_pydict({f: [r.get(f) for r in self._rows] for f in REPORT_FIELDS})
+                    if self._parquet_writer is None:
+                        self._parquet_writer = self._parquet.ParquetWriter(self.path, table.schema)
+                    self._parquet_writer.write_table(table)
+            else:
+                self._csv_writer.writerows(self._rows)
+                self._fh.flush()
+            self._rows = list()
+
+        def close(self):
+            self.flush()
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+            elif not self.path.endswith(".parquet"):
+                self._fh.close()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.close()
+
+    def cost_report(output_path: str,
+                    start: Optional[str]=None,
+                    end: Optional[str]=None,
+                    workspace: str=WORKSPACE_NAME,
+                    workspace_namespace: str=WORKSPACE_NAMESPACE,
+                    max_workers: int=16,
+                    max_submissions: Optional[int]=None,
+                    concurrent_submissions: int=4) -> Dict[str, Dict[str, float]]:
+        """
+        Estimate costs for submissions with dates in [start, end), writing shards to `output_path`. If provided,
+        only the first `max_submissions` submissions are costed. Up to `concurrent_submissions` submissions are
+        costed at a time, each with up to `max_workers` concurrent requests, and only their shards are held in memory.
+        Shards are written in chronological order of submission. Return total costs keyed by submission, method
+        configuration, task, and day.
+        """
+        totals: Dict[str, Dict[str, float]] = {k: defaultdict(float)
+                                               for k in ("submission", "method_configuration", "task", "day")}
+
+        def submission_costs(submission_id: str) -> list:
+            return list(cost_for_submission(submission_id, workspace, workspace_namespace, max_workers))
+
+        def write(writer: ShardWriter, submission: dict, shards: list):
+            submission_info = dict(submission_id=submission['submissionId'],
+                                   submission_date=submission['submissionDate'],
+                                   method_configuration=submission.get('methodConfigurationName', ""))
+            for shard_info in shards:
+                writer.write(dict(shard_info, **submission_info))
+                totals['submission'][submission_info['submission_id']] += shard_info['cost']
+                totals['method_configuration'][submission_info['method_configuration']] += shard_info['cost']
+                totals['task'][shard_info['task_name']] += shard_info['cost']
+                totals['day'][submission_info['submission_date'][:10]] += shard_info['cost']
+
+        submissions = islice(list_submissions_chronological(workspace, workspace_namespace, start, end),
+                             max_submissions)
+        with ShardWriter(output_path) as writer, ThreadPoolExecutor(max_workers=concurrent_submissions) as executor:
+            pending: Deque[Tuple[dict, Future]] = deque()
+            for submission in submissions:
+                pending.append((submission, executor.submit(submission_costs, submission['submissionId'])))
+                if len(pending) >= concurrent_submissions:
+                    submission, future = pending.popleft()
+                    write(writer, submission, future.result())
+            for submission, future in pending:
+                write(writer, submission, future.result())
+        return {k: dict(v) for k, v in totals.items()}
+
+with herzog.Cell("python"):
+    # Estimate costs for the first 5 submissions in the last 30 days. Use `max_submissions=None` for all of them.
+    start = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
+    report = cost_report("workspace_costs.csv", start=start, max_submissions=5)
+    for dimension in ("method_configuration", "task", "day"):
+        print(f"Total cost by {dimension}:")
+        for key, cost in sorted(report[dimension].items(), key=lambda item: item[1], reverse=True):
+            print("%40s" % key, "%10s" % ("$%.2f" % cost))
 
 with herzog.Cell("markdown"):
     """
@@ -120,7 +933,7 @@ with herzog.Cell("markdown"):
     """
 
 with herzog.Cell("python"):
-    # Define configurations for: cpus, memory(GB), runtime(hours), preemptible
+    # Define configurations for: cpus, memory(GB), disk(GB), runtime(hours), preemptible
     configurations = [(10, 64, 700, 5, False),
                       (8, 32, 700, 10, False),
                       (10, 64, 700, 5, True),
@@ -128,20 +941,152 @@ with herzog.Cell("python"):
                       (8, 32, 400, 10, True),
                       (8, 32, 100, 10, True)]
 
+    cpus, memory_gb, disk_gb, runtime_hours, preemptible = (np.array(column) for column in zip(*configurations))
+    n1_costs = estimate_job_costs(cpus, memory_gb, disk_gb, runtime_hours, preemptible, family="n1")
+    n2_costs = estimate_job_costs(cpus, memory_gb, disk_gb, runtime_hours, preemptible, family="n2")
+
     print("%8s" % "cpus",
           "%8s" % "memory",
           "%8s" % "disk",
           "%8s" % "runtime",
           "%12s" % "preemptible",
-          "%8s" % "cost")
-    for cpus, memory_gb, disk_gb, runtime_hours, preemptible in configurations:
-        cost = estimate_job_cost(cpus, memory_gb, disk_gb, runtime_hours, preemptible)
-        print("%8i" % cpus,
-              "%6iGB" % memory_gb,
-              "%6iGB" % disk_gb,
-              "%7ih" % runtime_hours,
-              "%12s" % str(preemptible),
-              "%8s" % ("$%.2f" % cost))
+          "%8s" % "n1 cost",
+          "%8s" % "n2 cost")
+    for i in range(len(configurations)):
+        print("%8i" % cpus[i],
+              "%6iGB" % memory_gb[i],
+              "%6iGB" % disk_gb[i],
+              "%7ih" % runtime_hours[i],
+              "%12s" % str(preemptible[i]),
+              "%8s" % ("$%.2f" % n1_costs[i]),
+              "%8s" % ("$%.2f" % n2_costs[i]))
+
+with herzog.Cell("python"):
+    # Sweep runtimes from 6 minutes to 100 hours, in 36 second steps, for a preemptible N2 configuration
+    runtimes = np.arange(0.1, 100, 0.01)
+    sweep_costs = estimate_job_costs(8, 32, 100, runtimes, True, family="n2")
+    print(f"{len(runtimes)} runtimes cost ${sweep_costs.min():.2f} to ${sweep_costs.max():.2f}")
+
+with herzog.Cell("markdown"):
+    """
+    Recommend the cheapest configuration for each task, based on the shards of a submission.
+
+    Shard runtime is modeled as `a + b / cpus`, fit to the runtimes of completed shards. Candidate cpu counts are
+    limited to the observed range, and one step of `cpu_options` beyond it in each direction; recommendations outside
+    the observed range are extrapolations, and are marked with `*`. Tasks that only ran with one cpu count are only
+    considered at that cpu count. Memory and disk are kept at or above the largest observed
+    values, since Cromwell metadata does not report usage. Preemptible configurations are costed with the task's
+    observed preemption rate, and are only considered if `allow_preemptible` is true, the preemption rate is at most
+    `max_preemption_rate`, and the predicted runtime is under the 24 hour preemptible VM limit. Configurations
+    predicted to run longer than `max_runtime_hours` are excluded.
+    """
+
+with herzog.Cell("python"):
+    # Custom machine memory per cpu limits, in GB
+    CUSTOM_MEMORY_PER_CPU = {"n1": (0.9, 6.5), "n2": (0.5, 8.0)}
+    PREEMPTIBLE_MAX_HOURS = 24
+
+    def fit_runtime(cpus: np.ndarray, runtime_hours: np.ndarray):
+        """Fit `runtime_hours = a + b / cpus`, returning a function of cpus."""
+        if 1 < len(np.unique(cpus)):
+            (a, b), *_ = np.linalg.lstsq(np.column_stack([np.ones(len(cpus)), 1 / cpus]), runtime_hours, rcond=None)
+            if 0 <= a and 0 <= b:
+                return lambda c: a + b / c
+        # Without a usable fit, assume runtime scales inversely with cpus
+        work = np.mean(runtime_hours * cpus)
+        return lambda c: work / c
+
+    def candidate_cpus(observed_cpus: np.ndarray, cpu_options) -> np.ndarray:
+        """Cpu counts within the observed range, plus the nearest option beyond it on each side."""
+        if 1 == len(observed_cpus):
+            return observed_cpus
+        options = np.union1d(np.array(cpu_options, dtype=float), observed_cpus)
+        lo, hi = observed_cpus.min(), observed_cpus.max()
+        return np.concatenate([options[options < lo][-1:],
+                               options[(lo <= options) & (options <= hi)],
+                               options[hi < options][:1]])
+
+    def recommend_configurations(shards: Iterable[dict],
+                                 max_runtime_hours: Optional[float]=None,
+                                 allow_preemptible: bool=True,
+                                 max_preemption_rate: float=0.2,
+                                 cpu_options=(1, 2, 4, 8, 16, 32, 64, 96),
+                                 families=("n1", "n2"),
+                                 region: str=DEFAULT_REGION) -> Dict[str, dict]:
+        by_task: Dict[str, list] = defaultdict(list)
+        for shard_info in shards:
+            if not shard_info['call_cached']:
+                by_task[shard_info['task_name']].append(shard_info)
+        recommendations = dict()
+        for task_name, task_shards in by_task.items():
+            done = [s for s in task_shards if s.get('execution_status', "Done") == "Done" and 0 < s['duration']]
+            if not done:
+                continue
+            preempted = sum(1 for s in task_shards if s['preemptible'] and s.get('execution_status') == "RetryableFailure")
+            preemptible_attempts = sum(1 for s in task_shards if s['preemptible'])
+            preemption_rate = preempted / preemptible_attempts if preemptible_attempts else 0.0
+            observed_cpus = np.array([s['number_of_cpus'] for s in done], dtype=float)
+            runtime = fit_runtime(observed_cpus, np.array([s['duration'] / 3600 for s in done]))
+            memory_gb = max(s['memory'] for s in done)
+            disk_gb = max(s['disk'] for s in done)
+
+            options = candidate_cpus(np.unique(observed_cpus), cpu_options)
+            cpus, family, preemptible = (a.ravel() for a in np.meshgrid(np.array(options, dtype=float),
+                                                                        np.array(families),
+                                                                        np.array([False, True])))
+            min_per_cpu = np.array([CUSTOM_MEMORY_PER_CPU[f][0] for f in family])
+            max_per_cpu = np.array([CUSTOM_MEMORY_PER_CPU[f][1] for f in family])
+            memory = np.maximum(memory_gb, cpus * min_per_cpu)
+            runtime_hours = runtime(cpus)
+            # Preempted attempts are rerun, extending runtime and adding cost
+            expected_runtime_hours = np.where(preemptible, runtime_hours * (1 + preemption_rate), runtime_hours)
+            cost = estimate_job_costs(cpus, memory, disk_gb, expected_runtime_hours, preemptible, region, family)
+            feasible = memory <= cpus * max_per_cpu
+            if max_runtime_hours is not None:
+                feasible &= expected_runtime_hours <= max_runtime_hours
+            preemptible_ok = allow_preemptible and preemption_rate <= max_preemption_rate
+            feasible &= ~preemptible | (preemptible_ok & (runtime_hours < PREEMPTIBLE_MAX_HOURS))
+            if not feasible.any():
+                continue
+            i = np.flatnonzero(feasible)[np.argmin(cost[feasible])]
+            current_cost = float(np.mean([s['cost'] for s in task_shards]))
+            recommendations[task_name] = dict(cpus=int(cpus[i]),
+                                              memory_gb=float(memory[i]),
+                                              disk_gb=disk_gb,
+                                              family=str(family[i]),
+                                              preemptible=bool(preemptible[i]),
+                                              runtime_hours=float(expected_runtime_hours[i]),
+                                              cost_per_shard=float(cost[i]),
+                                              current_cost_per_shard=current_cost,
+                                              extrapolated=not observed_cpus.min() <= cpus[i] <= observed_cpus.max(),
+                                              shards=len(task_shards))
+        return recommendations
+
+with herzog.Cell("python"):
+    recommendations = recommend_configurations(shards)
+    print("%30s" % "task_name",
+          "%5s" % "cpus",
+          "%7s" % "memory",
+          "%7s" % "disk",
+          "%7s" % "family",
+          "%12s" % "preemptible",
+          "%9s" % "runtime",
+          "%9s" % "cost",
+          "%9s" % "current",
+          "%10s" % "savings")
+    for task_name, r in recommendations.items():
+        print("%30s" % task_name,
+              "%5s" % ("%i%s" % (r['cpus'], "*" if r['extrapolated'] else "")),
+              "%5iGB" % r['memory_gb'],
+              "%5iGB" % r['disk_gb'],
+              "%7s" % r['family'],
+              "%12s" % r['preemptible'],
+              "%8.2fh" % r['runtime_hours'],
+              "%9s" % ("$%.2f" % r['cost_per_shard']),
+              "%9s" % ("$%.2f" % r['current_cost_per_shard']),
+              "%10s" % ("$%.2f" % ((r['current_cost_per_shard'] - r['cost_per_shard']) * r['shards'])))
+    if any(r['extrapolated'] for r in recommendations.values()):
+        print("* cpu count outside the observed range, runtime is extrapolated")
 
 with herzog.Cell("markdown"):
     """
@@ -151,3 +1096,4 @@ with herzog.Cell("markdown"):
       - [featured-notebooks GitHub](https://github.com/DataBiosphere/featured-notebooks) for this notebook.
     """
 ################################################ TESTS ################################################ noqa
+os.remove("workspace_costs.csv")
@@ -1,7 +1,6 @@
 # publish to: "terra-notebook-utils-tests" "test"
 import os
 import herzog
-from firecloud import fiss
 
 with herzog.Cell("markdown"):
     """
@@ -61,6 +60,173 @@ with herzog.Cell("python"):
     workspace_namespace = os.environ['GOOGLE_PROJECT']
     workspace_bucket = os.environ['WORKSPACE_BUCKET']
 
+# shared-cell: table-writer
+with herzog.Cell("markdown"):
+    """
+    `TableWriter` extends the terra-notebook-utils `table.Writer`, which uploads rows as TSV and then updates each
+    row with `Array[String]` attributes with a request of its own. Instead, `TableWriter` writes each batch of up to
+    `batch_size` rows, list attributes included, with a single batch upsert request. Batches are uploaded concurrently,
+    and failed batches are retried. Rows are written when the `with` block exits.
+    """
+
+# shared-cell: table-writer
+with herzog.Cell("python"):
+    import time
+    import random
+    from uuid import uuid4
+    from typing import Any, Dict, List, Optional, Tuple, Union
+    import requests
+    from firecloud import fiss
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def batch_upsert(entities: List[dict], workspace: str, workspace_namespace: str, retries: int=5) -> int:
+        # `fapi` has no batchUpsert wrapper, so the private `fapi.__post` is used. Private firecloud functions may
+        # change in any release, which is why firecloud is pinned in requirements.txt.
+        uri = f"workspaces/{workspace_namespace}/{workspace}/entities/batchUpsert"
+        for attempt in range(retries + 1):
+            try:
+                resp = fiss.fapi.__post(uri, json=entities)
+                if resp.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    resp.raise_for_status()
+                    return len(entities)
+            except requests.exceptions.ConnectionError:
+                if attempt == retries:
+                    raise
+            time.sleep(2 ** attempt + random.random())
+        return 0
+
+    class TableWriter(table.Writer):
+        def __init__(self,
+                     name: str,
+                     workspace: str=workspace,
+                     workspace_namespace: str=workspace_namespace,
+                     batch_size: int=500):
+            super().__init__(name, workspace, workspace_namespace)
+            self.batch_size = batch_size
+            self.rows_written = 0
+            self._batch: List[dict] = list()
+
+        def put_row(self, item: Union[Dict[str, Any], Tuple[str, Dict[str, Any]]]) -> Optional[str]:
+            row = table.Row(f"{uuid4()}", item) if isinstance(item, dict) else table.Row(*item)
+            attributes = {key: value for key, value in row.attributes.items() if value is not None}
+            if not attributes:
+                return None
+            # `table.Writer` produces update operations for every attribute except strings, which it uploads as TSV
+            operations = [dict(op="AddUpdateAttribute", attributeName=key, addUpdateAttribute=value)
+                          for key, value in attributes.items() if isinstance(value, str)]
+            operations.extend(self._get_row_update_request_data(table.Row(row.name, attributes)))
+            self._batch.append(dict(name=row.name, entityType=self.name, operations=operations))
+            self._upload()
+            return row.name
+
+        def _upload(self, force: bool=False):
+            if self._batch and (force or len(self._batch) >= self.batch_size):
+                self.submit(batch_upsert, self._batch, self._workspace, self._workspace_google_project)
+                self.rows_written += len(self._batch)
+                self._batch = list()
+
+        def _prepare_for_exit(self):
+            self._upload(force=True)
+
+        def __enter__(self):
+            fiss.fapi._set_session()  # Create the shared API session before using it from worker threads
+            self._start = time.time()
+            return super().__enter__()
+
+        def __exit__(self, exc_type, *args):
+            super().__exit__(exc_type, *args)
+            if exc_type is None:
+                duration = time.time() - self._start
+                print(f"Wrote {self.rows_written} rows to {self.name} in {duration:.2f}s",
+                      f"({self.rows_written / max(duration, 0.001):.0f} rows/s)")
+
+# shared-cell: drs-resolver
+with herzog.Cell("markdown"):
+    """
+    DRS URIs are resolved before rows are written, so unresolvable inputs are reported now rather than as failed
+    workflows later. URIs are resolved concurrently, and the name, size, checksums, and bucket location of each
+    resolved object are cached on the notebook's persistent disk for `ttl` seconds. Signed access URLs expire, so they
+    are not cached. Rows with unresolvable inputs are not written.
+    """
+
+# shared-cell: drs-resolver
+with herzog.Cell("python"):
+    import json
+    import sqlite3
+    import threading
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from typing import Iterable, Set, Tuple
+    from terra_notebook_utils import drs
+
+    class DRSResolver:
+        def __init__(self, path: str, ttl: float=3600, max_workers: int=16):
+            self.ttl = ttl
+            self.max_workers = max_workers
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS drs (uri TEXT PRIMARY KEY, info TEXT, resolved REAL)")
+
+        def _cached(self, uri: str) -> Optional[dict]:
+            with self._lock:
+                row = self._conn.execute("SELECT info, resolved FROM drs WHERE uri=?", (uri,)).fetchone()
+            if row is None or time.time() - row[1] >= self.ttl:
+                return None
+            return json.loads(row[0])
+
+        def _resolve(self, uri: str) -> dict:
+            info = drs.get_drs_info(uri)
+            # Signed access URLs may expire before the cache entry, and are fetched when objects are read instead
+            resolved = dict(name=info.name,
+                            size=info.size,
+                            checksums=info.checksums,
+                            bucket_name=info.bucket_name,
+                            key=info.key)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO drs VALUES (?, ?, ?)",
+                                   (uri, json.dumps(resolved), time.time()))
+            return resolved
+
+        def resolve(self, uris: Iterable[str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+            """Resolve DRS URIs, returning resolved object info and errors, each keyed by URI."""
+            resolved: Dict[str, dict] = dict()
+            errors: Dict[str, str] = dict()
+            futures: Dict[str, Future] = dict()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as e:
+                for uri in uris:
+                    cached = self._cached(uri)
+                    if cached is not None:
+                        resolved[uri] = cached
+                    elif uri not in futures:
+                        futures[uri] = e.submit(self._resolve, uri)
+                for uri, f in futures.items():
+                    try:
+                        resolved[uri] = f.result()
+                    except Exception as exc:
+                        errors[uri] = str(exc) or repr(exc)
+            return resolved, errors
+
+    drs_resolver = DRSResolver(os.path.join(os.path.expanduser("~"), ".drs_cache.sqlite"))
+
+    def drs_uris(row: Dict[str, Any]) -> Set[str]:
+        values = [v for value in row.values() for v in (value if isinstance(value, (list, tuple)) else [value])]
+        return {v for v in values if isinstance(v, str) and v.startswith("drs://")}
+
+    def check_drs_inputs(rows: Iterable[Dict[str, Any]], resolver: DRSResolver=drs_resolver) -> List[Dict[str, Any]]:
+        """Resolve the DRS URIs in `rows`, report those that cannot be resolved, and return rows resolving fully."""
+        rows = list(rows)
+        uris = set().union(*(drs_uris(row) for row in rows))
+        start = time.time()
+        resolved, errors = resolver.resolve(uris)
+        print(f"Resolved {len(resolved)} of {len(uris)} DRS URIs in {time.time() - start:.2f}s")
+        for uri, error in sorted(errors.items()):
+            print(f"Unable to resolve {uri}: {error}")
+        valid_rows = [row for row in rows if not drs_uris(row) & errors.keys()]
+        if len(valid_rows) < len(rows):
+            print(f"Skipping {len(rows) - len(valid_rows)} rows with unresolvable inputs")
+        return valid_rows
+
 with herzog.Cell("markdown"):
     """
     ## Option A: VCF merge workflow input for DRS URIs
@@ -71,16 +237,19 @@ with herzog.Cell("markdown"):
 table.delete("vcf-merge-input-drs")
 with herzog.Cell("python"):
     table_name = "vcf-merge-input-drs"
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   inputs=["drs://dg.4503/697f611b-aa8a-4bd7-a80b-946276273833",
-                                           "drs://dg.4503/ce212b62-e796-4b32-becb-361f272cead0"],
-                                   output=f"{workspace_bucket}/merged/drs_combined_a.vcf.gz"))
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   inputs=["drs://dg.4503/93286e47-3d09-47e6-ac87-4c2975ef0c3f",
-                                           "drs://dg.4503/aba6b011-2ab4-4739-beb4-c1eeaee60c74"],
-                                   output=f"{workspace_bucket}/merged/drs_combined_b.vcf.gz"))
+    rows = [dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 inputs=["drs://dg.4503/697f611b-aa8a-4bd7-a80b-946276273833",
+                         "drs://dg.4503/ce212b62-e796-4b32-becb-361f272cead0"],
+                 output=f"{workspace_bucket}/merged/drs_combined_a.vcf.gz"),
+            dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 inputs=["drs://dg.4503/93286e47-3d09-47e6-ac87-4c2975ef0c3f",
+                         "drs://dg.4503/aba6b011-2ab4-4739-beb4-c1eeaee60c74"],
+                 output=f"{workspace_bucket}/merged/drs_combined_b.vcf.gz")]
+    with TableWriter(table_name) as writer:
+        for row in check_drs_inputs(rows):
+            writer.put_row(row)
 
 with herzog.Cell("markdown"):
     """
@@ -99,16 +268,17 @@ with herzog.Cell("markdown"):
 table.delete("vcf-merge-input-bucket")
 with herzog.Cell("python"):
     table_name = "vcf-merge-input-bucket"
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   inputs=[f"{workspace_bucket}/vcfsa/chr1.vcf.gz",
-                                           f"{workspace_bucket}/vcfsb/chr1.vcf.gz"],
-                                   output=f"{workspace_bucket}/merged/chr1.vcf.gz"))
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   inputs=[f"{workspace_bucket}/vcfsa/chr2.vcf.gz",
-                                           f"{workspace_bucket}/vcfsb/chr2.vcf.gz"],
-                                   output=f"{workspace_bucket}/merged/chr2.vcf.gz"))
+    with TableWriter(table_name) as writer:
+        writer.put_row(dict(workspace=workspace,
+                            billing_project=workspace_namespace,
+                            inputs=[f"{workspace_bucket}/vcfsa/chr1.vcf.gz",
+                                    f"{workspace_bucket}/vcfsb/chr1.vcf.gz"],
+                            output=f"{workspace_bucket}/merged/chr1.vcf.gz"))
+        writer.put_row(dict(workspace=workspace,
+                            billing_project=workspace_namespace,
+                            inputs=[f"{workspace_bucket}/vcfsa/chr2.vcf.gz",
+                                    f"{workspace_bucket}/vcfsb/chr2.vcf.gz"],
+                            output=f"{workspace_bucket}/merged/chr2.vcf.gz"))
 
 with herzog.Cell("markdown"):
     """
@@ -127,21 +297,111 @@ with herzog.Cell("markdown"):
 table.delete("vcf-merge-input-mixed")
 with herzog.Cell("python"):
     table_name = "vcf-merge-input-mixed"
-    table.put_row(table_name,
-                  dict(workspace=workspace,
-                       billing_project=workspace_namespace,
-                       inputs=["drs://dg.4503/697f611b-aa8a-4bd7-a80b-946276273833",
-                               f"{workspace_bucket}/vcfs_to_merge/ce212b62-e796-4b32-becb-361f272cead0.vcf.g"],
-                       output=f"{workspace_bucket}/merged/mixed.vcf.gz"))
-    table.put_row(table_name,
-                  dict(workspace=workspace,
+    rows = [dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 inputs=["drs://dg.4503/697f611b-aa8a-4bd7-a80b-946276273833",
+                         f"{workspace_bucket}/vcfs_to_merge/ce212b62-e796-4b32-becb-361f272cead0.vcf.g"],
+                 output=f"{workspace_bucket}/merged/mixed.vcf.gz"),
+            dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 inputs=["drs://dg.4503/93286e47-3d09-47e6-ac87-4c2975ef0c3f",
+                         f"{workspace_bucket}/vcfs_to_merge/aba6b011-2ab4-4739-beb4-c1eeaee60c74.vcf.gz"],
+                 output=f"{workspace_bucket}/merged/mixed.vcf.gz")]
+    with TableWriter(table_name) as writer:
+        for row in check_drs_inputs(rows):
+            writer.put_row(row)
+
+with herzog.Cell("markdown"):
+    """
+    ## Option D: Plan merges automatically
+    Instead of writing each merge row by hand, VCFs may be grouped by the chromosome named in their file names, e.g.
+    `a-chr1.vcf.gz` and `freeze8.chr1.pass_only.vcf.gz`, producing one merge row per chromosome. VCFs may be listed
+    from Google bucket prefixes, or from a data table column of DRS URIs along with a column of file names. Listings
+    are read in a single pass, page by page, so prefixes containing tens of thousands of objects are fine.
+
+    To group by another key, such as a genomic region, pass a regular expression with one group to `plan_merges`.
+    """
+
+with herzog.Cell("python"):
+    import re
+    from collections import defaultdict
+    from typing import Iterable, Tuple
+    from google.cloud import storage
+
+    # Chromosome keys in file names, e.g. "chr1", "chr22", or "chrX"
+    CHROMOSOME_PATTERN = re.compile(r"(?<![A-Za-z0-9])(chr(?:[0-9]{1,2}|X|Y|M))(?![0-9])", re.IGNORECASE)
+
+    def list_bucket_vcfs(url: str, suffixes: Tuple[str, ...]=(".vcf.gz", ".vcf.bgz")) -> Iterable[Tuple[str, str]]:
+        """Yield (file name, URL) for VCFs under the Google bucket prefix `url`, e.g. "gs://my-bucket/vcfs/"."""
+        bucket_name, _, prefix = url[len("gs://"):].partition("/")
+        for blob in storage.Client().list_blobs(bucket_name, prefix=prefix, fields="items(name),nextPageToken"):
+            if blob.name.endswith(suffixes):
+                yield blob.name.rsplit("/", 1)[-1], f"gs://{bucket_name}/{blob.name}"
+
+    def list_table_vcfs(table_name: str, uri_column: str, name_column: str) -> Iterable[Tuple[str, str]]:
+        """Yield (file name, URI) for rows of a data table, e.g. DRS URIs and file names of a Gen3 table."""
+        for row in table.list_rows(table_name):
+            if row.attributes.get(uri_column) and row.attributes.get(name_column):
+                yield row.attributes[name_column], row.attributes[uri_column]
+
+    def plan_merges(vcfs: Iterable[Tuple[str, str]], pattern: "re.Pattern"=CHROMOSOME_PATTERN) -> Dict[str, List[str]]:
+        """Group VCF URIs by the key `pattern` finds in their file names. VCFs without a key are skipped."""
+        groups: Dict[str, List[str]] = defaultdict(list)
+        seen = set()
+        skipped = 0
+        for name, uri in vcfs:
+            m = pattern.search(name)
+            if m is None:
+                skipped += 1
+            elif uri not in seen:
+                seen.add(uri)
+                groups[m.group(1).lower()].append(uri)
+        if skipped:
+            print(f"Skipped {skipped} VCFs without a merge key")
+        return dict(groups)
+
+    def merge_rows(groups: Dict[str, List[str]], output_prefix: str) -> Iterable[Dict[str, Any]]:
+        """Yield one merge row per key with at least two inputs, in natural order of keys, e.g. chr2 before chr10."""
+        def natural_order(key: str):
+            return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", key)]
+
+        for key in sorted(groups, key=natural_order):
+            if 2 > len(groups[key]):
+                print(f"Skipping {key}, which has only one input: {groups[key][0]}")
+                continue
+            yield dict(workspace=workspace,
                        billing_project=workspace_namespace,
-                       inputs=["drs://dg.4503/93286e47-3d09-47e6-ac87-4c2975ef0c3f",
-                               f"{workspace_bucket}/vcfs_to_merge/aba6b011-2ab4-4739-beb4-c1eeaee60c74.vcf.gz"],
-                       output=f"{workspace_bucket}/merged/mixed.vcf.gz"))
+                       inputs=groups[key],
+                       output=f"{output_prefix.rstrip('/')}/{key}.vcf.gz")
+
+table.delete("vcf-merge-input-planned")
+with herzog.Cell("python"):
+    import itertools
+
+    table_name = "vcf-merge-input-planned"
+    vcfs = itertools.chain(list_bucket_vcfs(f"{workspace_bucket}/vcfsa/"),
+                           list_bucket_vcfs(f"{workspace_bucket}/vcfsb/"))
+    # Uncomment to merge DRS URIs listed in a data table instead
+    # vcfs = list_table_vcfs("my-vcfs", uri_column="drs_uri", name_column="file_name")
+    groups = plan_merges(vcfs)
+    with TableWriter(table_name) as writer:
+        for row in check_drs_inputs(merge_rows(groups, f"{workspace_bucket}/merged")):
+            writer.put_row(row)
 
 
 ################################################ TESTS ################################################ noqa
+test_vcfs = [("a-chr1.vcf.gz", "gs://a/a-chr1.vcf.gz"),
+             ("freeze8.chr10.pass_only.vcf.gz", "drs://dg.4503/a10"),
+             ("b-chr1.vcf.gz", "gs://b/b-chr1.vcf.gz"),
+             ("b-CHR10.vcf.gz", "gs://b/b-CHR10.vcf.gz"),
+             ("b-chr2.vcf.gz", "gs://b/b-chr2.vcf.gz"),
+             ("samples.vcf.gz", "gs://b/samples.vcf.gz")]
+groups = plan_merges(test_vcfs)
+assert groups == {"chr1": ["gs://a/a-chr1.vcf.gz", "gs://b/b-chr1.vcf.gz"],
+                  "chr10": ["drs://dg.4503/a10", "gs://b/b-CHR10.vcf.gz"],
+                  "chr2": ["gs://b/b-chr2.vcf.gz"]}
+assert [row['output'] for row in merge_rows(groups, "gs://out/")] == ["gs://out/chr1.vcf.gz", "gs://out/chr10.vcf.gz"]
+
 resp = fiss.fapi.get_entities(os.environ['GOOGLE_PROJECT'], os.environ['WORKSPACE_NAME'], "vcf-merge-input-drs")
 resp.raise_for_status()
 rows = resp.json()
@@ -1,7 +1,6 @@
 # publish to: "terra-notebook-utils-tests" "test"
 import os
 import herzog
-from firecloud import fiss
 
 with herzog.Cell("markdown"):
     """
@@ -39,6 +38,306 @@ with herzog.Cell("python"):
     workspace_namespace = os.environ['GOOGLE_PROJECT']
     workspace_bucket = os.environ['WORKSPACE_BUCKET']
 
+# shared-cell: table-writer
+with herzog.Cell("markdown"):
+    """
+    `TableWriter` extends the terra-notebook-utils `table.Writer`, which uploads rows as TSV and then updates each
+    row with `Array[String]` attributes with a request of its own. Instead, `TableWriter` writes each batch of up to
+    `batch_size` rows, list attributes included, with a single batch upsert request. Batches are uploaded concurrently,
+    and failed batches are retried. Rows are written when the `with` block exits.
+    """
+
+# shared-cell: table-writer
+with herzog.Cell("python"):
+    import time
+    import random
+    from uuid import uuid4
+    from typing import Any, Dict, List, Optional, Tuple, Union
+    import requests
+    from firecloud import fiss
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def batch_upsert(entities: List[dict], workspace: str, workspace_namespace: str, retries: int=5) -> int:
+        # `fapi` has no batchUpsert wrapper, so the private `fapi.__post` is used. Private firecloud functions may
+        # change in any release, which is why firecloud is pinned in requirements.txt.
+        uri = f"workspaces/{workspace_namespace}/{workspace}/entities/batchUpsert"
+        for attempt in range(retries + 1):
+            try:
+                resp = fiss.fapi.__post(uri, json=entities)
+                if resp.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    resp.raise_for_status()
+                    return len(entities)
+            except requests.exceptions.ConnectionError:
+                if attempt == retries:
+                    raise
+            time.sleep(2 ** attempt + random.random())
+        return 0
+
+    class TableWriter(table.Writer):
+        def __init__(self,
+                     name: str,
+                     workspace: str=workspace,
+                     workspace_namespace: str=workspace_namespace,
+                     batch_size: int=500):
+            super().__init__(name, workspace, workspace_namespace)
+            self.batch_size = batch_size
+            self.rows_written = 0
+            self._batch: List[dict] = list()
+
+        def put_row(self, item: Union[Dict[str, Any], Tuple[str, Dict[str, Any]]]) -> Optional[str]:
+            row = table.Row(f"{uuid4()}", item) if isinstance(item, dict) else table.Row(*item)
+            attributes = {key: value for key, value in row.attributes.items() if value is not None}
+            if not attributes:
+                return None
+            # `table.Writer` produces update operations for every attribute except strings, which it uploads as TSV
+            operations = [dict(op="AddUpdateAttribute", attributeName=key, addUpdateAttribute=value)
+                          for key, value in attributes.items() if isinstance(value, str)]
+            operations.extend(self._get_row_update_request_data(table.Row(row.name, attributes)))
+            self._batch.append(dict(name=row.name, entityType=self.name, operations=operations))
+            self._upload()
+            return row.name
+
+        def _upload(self, force: bool=False):
+            if self._batch and (force or len(self._batch) >= self.batch_size):
+                self.submit(batch_upsert, self._batch, self._workspace, self._workspace_google_project)
+                self.rows_written += len(self._batch)
+                self._batch = list()
+
+        def _prepare_for_exit(self):
+            self._upload(force=True)
+
+        def __enter__(self):
+            fiss.fapi._set_session()  # Create the shared API session before using it from worker threads
+            self._start = time.time()
+            return super().__enter__()
+
+        def __exit__(self, exc_type, *args):
+            super().__exit__(exc_type, *args)
+            if exc_type is None:
+                duration = time.time() - self._start
+                print(f"Wrote {self.rows_written} rows to {self.name} in {duration:.2f}s",
+                      f"({self.rows_written / max(duration, 0.001):.0f} rows/s)")
+
+# shared-cell: drs-resolver
+with herzog.Cell("markdown"):
+    """
+    DRS URIs are resolved before rows are written, so unresolvable inputs are reported now rather than as failed
+    workflows later. URIs are resolved concurrently, and the name, size, checksums, and bucket location of each
+    resolved object are cached on the notebook's persistent disk for `ttl` seconds. Signed access URLs expire, so they
+    are not cached. Rows with unresolvable inputs are not written.
+    """
+
+# shared-cell: drs-resolver
+with herzog.Cell("python"):
+    import json
+    import sqlite3
+    import threading
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from typing import Iterable, Set, Tuple
+    from terra_notebook_utils import drs
+
+    class DRSResolver:
+        def __init__(self, path: str, ttl: float=3600, max_workers: int=16):
+            self.ttl = ttl
+            self.max_workers = max_workers
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS drs (uri TEXT PRIMARY KEY, info TEXT, resolved REAL)")
+
+        def _cached(self, uri: str) -> Optional[dict]:
+            with self._lock:
+                row = self._conn.execute("SELECT info, resolved FROM drs WHERE uri=?", (uri,)).fetchone()
+            if row is None or time.time() - row[1] >= self.ttl:
+                return None
+            return json.loads(row[0])
+
+        def _resolve(self, uri: str) -> dict:
+            info = drs.get_drs_info(uri)
+            # Signed access URLs may expire before the cache entry, and are fetched when objects are read instead
+            resolved = dict(name=info.name,
+                            size=info.size,
+                            checksums=info.checksums,
+                            bucket_name=info.bucket_name,
+                            key=info.key)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO drs VALUES (?, ?, ?)",
+                                   (uri, json.dumps(resolved), time.time()))
+            return resolved
+
+        def resolve(self, uris: Iterable[str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+            """Resolve DRS URIs, returning resolved object info and errors, each keyed by URI."""
+            resolved: Dict[str, dict] = dict()
+            errors: Dict[str, str] = dict()
+            futures: Dict[str, Future] = dict()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as e:
+                for uri in uris:
+                    cached = self._cached(uri)
+                    if cached is not None:
+                        resolved[uri] = cached
+                    elif uri not in futures:
+                        futures[uri] = e.submit(self._resolve, uri)
+                for uri, f in futures.items():
+                    try:
+                        resolved[uri] = f.result()
+                    except Exception as exc:
+                        errors[uri] = str(exc) or repr(exc)
+            return resolved, errors
+
+    drs_resolver = DRSResolver(os.path.join(os.path.expanduser("~"), ".drs_cache.sqlite"))
+
+    def drs_uris(row: Dict[str, Any]) -> Set[str]:
+        values = [v for value in row.values() for v in (value if isinstance(value, (list, tuple)) else [value])]
+        return {v for v in values if isinstance(v, str) and v.startswith("drs://")}
+
+    def check_drs_inputs(rows: Iterable[Dict[str, Any]], resolver: DRSResolver=drs_resolver) -> List[Dict[str, Any]]:
+        """Resolve the DRS URIs in `rows`, report those that cannot be resolved, and return rows resolving fully."""
+        rows = list(rows)
+        uris = set().union(*(drs_uris(row) for row in rows))
+        start = time.time()
+        resolved, errors = resolver.resolve(uris)
+        print(f"Resolved {len(resolved)} of {len(uris)} DRS URIs in {time.time() - start:.2f}s")
+        for uri, error in sorted(errors.items()):
+            print(f"Unable to resolve {uri}: {error}")
+        valid_rows = [row for row in rows if not drs_uris(row) & errors.keys()]
+        if len(valid_rows) < len(rows):
+            print(f"Skipping {len(rows) - len(valid_rows)} rows with unresolvable inputs")
+        return valid_rows
+
+with herzog.Cell("markdown"):
+    """
+    Before rows are written, the samples of each row are checked against the header of its input VCF, so that typos
+    and samples missing from a VCF are reported now rather than as failed workflows later. Only the first few blocks
+    of each VCF are read, with HTTP range requests, until the `#CHROM` line listing the VCF's samples is found; VCF
+    bodies are never downloaded. Headers are cached on the notebook's persistent disk by object generation, or by
+    checksum for DRS objects, and are read again only if a VCF changes. Rows with missing samples are not written.
+    """
+
+with herzog.Cell("python"):
+    import io
+    import gzip
+    from google.cloud import storage
+    from terra_notebook_utils.blobstore.url import URLBlob
+
+    HEADER_CHUNK_SIZE = 256 * 1024
+
+    class HTTPRangeReader(io.RawIOBase):
+        """Read an HTTP(S) URL, such as a signed DRS access URL, with a range request for each read."""
+        def __init__(self, url: str):
+            self.url = url
+            self._pos = 0
+
+        def readable(self) -> bool:
+            return True
+
+        def readinto(self, b) -> int:
+            resp = requests.get(self.url, headers=dict(Range=f"bytes={self._pos}-{self._pos + len(b) - 1}"))
+            if 416 == resp.status_code:
+                return 0
+            resp.raise_for_status()
+            if 206 != resp.status_code:
+                raise OSError(f"Range requests are not supported for {self.url}")
+            data = resp.content[:len(b)]
+            b[:len(data)] = data
+            self._pos += len(data)
+            return len(data)
+
+    def read_vcf_samples(fh: io.IOBase) -> List[str]:
+        """Read the samples from the `#CHROM` header line of a gzipped or bgzipped VCF, stopping there."""
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=fh), encoding="utf-8") as text:
+            for line in text:
+                if line.startswith("#CHROM"):
+                    return line.rstrip("\r\n").split("\t")[9:]
+                elif not line.startswith("##"):
+                    break
+        raise ValueError("VCF header has no #CHROM line")
+
+    class VCFHeaders:
+        def __init__(self, path: str, resolver: DRSResolver=drs_resolver, max_workers: int=8):
+            self.resolver = resolver
+            self.max_workers = max_workers
+            self._client = storage.Client()  # Shared by reads of all Google Storage URLs
+            self._lock = threading.Lock()
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS headers "
+                                   "(uri TEXT PRIMARY KEY, version TEXT, samples TEXT)")
+
+        def _version(self, uri: str) -> str:
+            if uri.startswith("drs://"):
+                resolved, errors = self.resolver.resolve([uri])
+                if uri in errors:
+                    raise ValueError(errors[uri])
+                return json.dumps(resolved[uri]['checksums'], sort_keys=True)
+            elif uri.startswith("gs://"):
+                bucket_name, _, key = uri[len("gs://"):].partition("/")
+                native_blob = self._client.bucket(bucket_name).blob(key)
+                native_blob.reload()
+                return f"{native_blob.generation}"
+            else:
+                raise ValueError(f"Expected a DRS URI or Google Storage URL, got {uri}")
+
+        def _open(self, uri: str, version: str) -> io.IOBase:
+            if uri.startswith("drs://"):
+                blob = drs.blob_for_url(uri, workspace_namespace)
+                if isinstance(blob, URLBlob):
+                    return io.BufferedReader(HTTPRangeReader(blob.url), HEADER_CHUNK_SIZE)
+                return blob.open(chunk_size=HEADER_CHUNK_SIZE)
+            else:
+                bucket_name, _, key = uri[len("gs://"):].partition("/")
+                native_blob = self._client.bucket(bucket_name).blob(key, generation=int(version))
+                return native_blob.open("rb", chunk_size=HEADER_CHUNK_SIZE)
+
+        def samples(self, uri: str) -> List[str]:
+            """Return the samples of the VCF at `uri`, reading its header only if it changed since it was cached."""
+            version = self._version(uri)
+            with self._lock:
+                row = self._conn.execute("SELECT version, samples FROM headers WHERE uri=?", (uri,)).fetchone()
+            if row is not None and row[0] == version:
+                return json.loads(row[1])
+            with self._open(uri, version) as fh:
+                samples = read_vcf_samples(fh)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO headers VALUES (?, ?, ?)",
+                                   (uri, version, json.dumps(samples)))
+            return samples
+
+        def sample_columns(self, uris: Iterable[str]) -> Tuple[Dict[str, Dict[str, int]], Dict[str, str]]:
+            """Map the samples of each VCF to their header columns, returning column maps and errors keyed by URI."""
+            columns: Dict[str, Dict[str, int]] = dict()
+            errors: Dict[str, str] = dict()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as e:
+                futures = {uri: e.submit(self.samples, uri) for uri in set(uris)}
+                for uri, f in futures.items():
+                    try:
+                        columns[uri] = {sample: 9 + i for i, sample in enumerate(f.result())}
+                    except Exception as exc:
+                        errors[uri] = str(exc) or repr(exc)
+            return columns, errors
+
+    vcf_headers = VCFHeaders(os.path.join(os.path.expanduser("~"), ".vcf_header_cache.sqlite"))
+
+    def check_vcf_samples(rows: Iterable[Dict[str, Any]], headers: VCFHeaders=vcf_headers) -> List[Dict[str, Any]]:
+        """Check the samples of `rows` against the headers of their input VCFs, returning rows with all samples."""
+        rows = list(rows)
+        start = time.time()
+        columns, errors = headers.sample_columns(row['input'] for row in rows)
+        print(f"Read {len(columns)} of {len(columns) + len(errors)} VCF headers in {time.time() - start:.2f}s")
+        for uri, error in sorted(errors.items()):
+            print(f"Unable to read the header of {uri}: {error}")
+        valid_rows = list()
+        for row in rows:
+            if row['input'] in columns:
+                missing = [s for s in row['samples'] if s not in columns[row['input']]]
+                if missing:
+                    print(f"{len(missing)} samples for {row['output']} are not in {row['input']}, e.g. {missing[:5]}")
+                else:
+                    valid_rows.append(row)
+        if len(valid_rows) < len(rows):
+            print(f"Skipping {len(rows) - len(valid_rows)} rows with unreadable inputs or missing samples")
+        return valid_rows
+
 with herzog.Cell("markdown"):
     """
     ## Option A: VCF subsample workflow input for DRS URIs
@@ -49,26 +348,21 @@ with herzog.Cell("markdown"):
 table.delete("vcf-subsample-input-drs")
 with herzog.Cell("python"):
     table_name = "vcf-subsample-input-drs"
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   input="drs://dg.4503/b2871873-8dcb-4a3e-a926-a17ab4a19f0a",
-                                   output=f"{workspace_bucket}/subsampled/drs_subsampled_a.vcf.gz",
-                                   samples=["NWD999037", "NWD996859"]))
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   input="drs://dg.4503/06dc6204-a426-11ea-b7de-179adfdbfdb4",
-                                   output=f"{workspace_bucket}/subsampled/drs_subsampled_b.vcf.gz",
-                                   samples=["NWD927369", "NWD934675", "NWD952492"]))
-
-    # Samples may also be loaded from a file. If your samples file is stored in your workspace bucket,
-    # it can be made available to the notebook using the `gsutil` command:
-    # !gsutil cp "gs:${WORKSPACE_BUCKET}//my/samples/file" "samples"
-    #
-    # Now it may be opened for reading or used in other subroutines.
-    # with open("samples") as fh:
-    #     pass
-    #
-    # Parsing sample ids from the file is left as an exercise for the reader.
+    rows = [dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 input="drs://dg.4503/b2871873-8dcb-4a3e-a926-a17ab4a19f0a",
+                 output=f"{workspace_bucket}/subsampled/drs_subsampled_a.vcf.gz",
+                 samples=["NWD999037", "NWD996859"]),
+            dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 input="drs://dg.4503/06dc6204-a426-11ea-b7de-179adfdbfdb4",
+                 output=f"{workspace_bucket}/subsampled/drs_subsampled_b.vcf.gz",
+                 samples=["NWD927369", "NWD934675", "NWD952492"])]
+    with TableWriter(table_name) as writer:
+        for row in check_vcf_samples(check_drs_inputs(rows)):
+            writer.put_row(row)
+
+    # Samples may also be loaded from a file in your workspace bucket, see Option C.
 
 with herzog.Cell("markdown"):
     """
@@ -87,23 +381,124 @@ with herzog.Cell("markdown"):
 table.delete("vcf-subsample-input-bucket")
 with herzog.Cell("python"):
     table_name = "vcf-subsample-input-bucket"
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   input=f"{workspace_bucket}/vcfsa/chr1.vcf.gz",
-                                   output=f"{workspace_bucket}/subsampled/chr1.vcf.gz",
-                                   samples=["NWD957804"]))
-    table.put_row(table_name, dict(workspace=workspace,
-                                   billing_project=workspace_namespace,
-                                   input=f"{workspace_bucket}/vcfsa/chr2.vcf.gz",
-                                   output=f"{workspace_bucket}/subsampled/chr2.vcf.gz",
-                                   samples=["NWD860709", "NWD496635", "NWD637453", "NWD994242"]))
-
-    # Samples may also be loaded from a file. If your samples file is stored in your workspace bucket,
-    # it can be made available to the notebook using the `gsutil` command:
-    # !gsutil cp "gs:${WORKSPACE_BUCKET}//my/samples/file" "samples"
-    #
-    # Now it may be opened for reading or used in other subroutines.
-    # with open("samples") as fh:
-    #     pass
-    #
-    # Parsing sample ids from the file is left as an exercise for the reader.
+    rows = [dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 input=f"{workspace_bucket}/vcfsa/chr1.vcf.gz",
+                 output=f"{workspace_bucket}/subsampled/chr1.vcf.gz",
+                 samples=["NWD957804"]),
+            dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 input=f"{workspace_bucket}/vcfsa/chr2.vcf.gz",
+                 output=f"{workspace_bucket}/subsampled/chr2.vcf.gz",
+                 samples=["NWD860709", "NWD496635", "NWD637453", "NWD994242"])]
+    with TableWriter(table_name) as writer:
+        for row in check_vcf_samples(check_drs_inputs(rows)):
+            writer.put_row(row)
+
+    # Samples may also be loaded from a file in your workspace bucket, see Option C.
+
+with herzog.Cell("markdown"):
+    """
+    ## Option C: VCF subsample workflow input with samples loaded from a file
+    Sample ids may be read directly from a file in a Google bucket, without first copying it to the notebook. Files
+    may list one sample id per line, or be CSV or TSV files with a column of sample ids, and may be gzipped. Blank
+    lines and lines starting with "#" are ignored, and duplicate ids are dropped.
+
+    Large sample lists are split into several rows of at most `samples_per_row` samples, each producing its own
+    subsampled VCF.
+    """
+
+with herzog.Cell("python"):
+    import csv
+    from typing import Iterator
+
+    def open_sample_file(url: str) -> io.TextIOBase:
+        """Open a possibly gzipped text file in a Google bucket for streaming reads."""
+        bucket_name, _, key = url[len("gs://"):].partition("/")
+        fh = storage.Client().bucket(bucket_name).blob(key).open("rb", chunk_size=8 * 1024 * 1024)
+        if key.endswith((".gz", ".bgz")):
+            fh = gzip.GzipFile(fileobj=fh)
+        return io.TextIOWrapper(fh, encoding="utf-8")
+
+    def read_sample_ids(url: str, column: Optional[str]=None) -> Iterator[str]:
+        """
+        Yield unique sample ids from `url` in the order they first appear. If `column` is provided, the file is read as
+        CSV, or TSV if its name contains ".tsv", and ids are taken from the named column.
+        """
+        seen = set()
+        with open_sample_file(url) as fh:
+            lines = (line for line in fh if not line.startswith("#"))
+            if column is None:
+                ids: Iterable[str] = (line.strip() for line in lines)
+            else:
+                reader = csv.reader(lines, delimiter="\t" if ".tsv" in url else ",")
+                index = next(reader).index(column)
+                ids = (row[index].strip() for row in reader if len(row) > index)
+            for sample_id in ids:
+                if sample_id and sample_id not in seen:
+                    seen.add(sample_id)
+                    yield sample_id
+
+    def chunk_samples(sample_ids: Iterable[str], samples_per_row: int) -> Iterator[List[str]]:
+        chunk: List[str] = list()
+        for sample_id in sample_ids:
+            chunk.append(sample_id)
+            if len(chunk) == samples_per_row:
+                yield chunk
+                chunk = list()
+        if chunk:
+            yield chunk
+
+# Upload a test samples file, with duplicates, to the workspace bucket
+samples_blob = f"{os.environ['WORKSPACE_BUCKET']}/samples/test-samples.txt.gz"[len("gs://"):].split("/", 1)
+storage.Client().bucket(samples_blob[0]).blob(samples_blob[1]).upload_from_string(
+    gzip.compress("".join(f"NWD{i % 2500:06}\n" for i in range(3000)).encode("utf-8"))
+)
+# Upload a test VCF, with bgzip style multi-member compression, including the test samples
+vcf_blob = f"{os.environ['WORKSPACE_BUCKET']}/vcfs/cohort.chr1.vcf.gz"[len("gs://"):].split("/", 1)
+storage.Client().bucket(vcf_blob[0]).blob(vcf_blob[1]).upload_from_string(b"".join([
+    gzip.compress(b"##fileformat=VCFv4.2\n##contig=<ID=chr1>\n"),
+    gzip.compress("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+                            + [f"NWD{i:06}" for i in range(2600)]).encode("utf-8") + b"\n"),
+    *[gzip.compress(f"chr1\t{pos}\t.\tA\tG\t.\tPASS\t.\tGT".encode("utf-8") + b"\t0|1" * 2600 + b"\n")
+      for pos in range(1, 200)],
+]))
+table.delete("vcf-subsample-input-file")
+with herzog.Cell("python"):
+    table_name = "vcf-subsample-input-file"
+    samples_per_row = 1000
+    sample_ids = read_sample_ids(f"{workspace_bucket}/samples/test-samples.txt.gz")
+    # sample_ids = read_sample_ids(f"{workspace_bucket}/samples/manifest.tsv", column="sample_id")
+    rows = [dict(workspace=workspace,
+                 billing_project=workspace_namespace,
+                 input=f"{workspace_bucket}/vcfs/cohort.chr1.vcf.gz",
+                 output=f"{workspace_bucket}/subsampled/cohort_subsampled_{i}.chr1.vcf.gz",
+                 samples=samples)
+            for i, samples in enumerate(chunk_samples(sample_ids, samples_per_row))]
+    with TableWriter(table_name, batch_size=20) as writer:
+        for row in check_vcf_samples(check_drs_inputs(rows)):
+            writer.put_row(row)
+
+
+################################################ TESTS ################################################ noqa
+resp = fiss.fapi.get_entities(os.environ['GOOGLE_PROJECT'], os.environ['WORKSPACE_NAME'], "vcf-subsample-input-file")
+resp.raise_for_status()
+file_rows = sorted(resp.json(), key=lambda row: row['attributes']['output'])
+assert [len(row['attributes']['samples']['items']) for row in file_rows] == [1000, 1000, 500]
+assert file_rows[0]['attributes']['samples']['items'][:2] == ["NWD000000", "NWD000001"]
+assert len({s for row in file_rows for s in row['attributes']['samples']['items']}) == 2500
+
+vcf_url = f"{os.environ['WORKSPACE_BUCKET']}/vcfs/cohort.chr1.vcf.gz"
+assert vcf_headers.samples(vcf_url)[:2] == ["NWD000000", "NWD000001"]
+bad_row = dict(input=vcf_url, output="bad.vcf.gz", samples=["NWD000001", "not-a-sample"])
+assert [] == check_vcf_samples([bad_row])
+assert [] == check_vcf_samples([dict(bad_row, input=vcf_url + ".missing", samples=["NWD000001"])])
+good_row = dict(bad_row, samples=["NWD000001", "NWD002599"])
+assert [good_row] == check_vcf_samples([good_row])
+
+manifest_blob = f"{os.environ['WORKSPACE_BUCKET']}/samples/test-manifest.csv"[len("gs://"):].split("/", 1)
+storage.Client().bucket(manifest_blob[0]).blob(manifest_blob[1]).upload_from_string(
+    "# test manifest\nsample_id,study\nNWD000001,a\n#NWD000002,a\nNWD000003,b\nNWD000001,b\n"
+)
+manifest_url = f"{os.environ['WORKSPACE_BUCKET']}/samples/test-manifest.csv"
+assert ["NWD000001", "NWD000003"] == list(read_sample_ids(manifest_url, column="sample_id"))
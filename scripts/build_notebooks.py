@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Generate `notebook.ipynb` for each notebook directory, regenerating only notebooks whose sources have changed.
+
+Generated notebooks are cached by a content hash of the notebook's `main.py`, its `requirements.txt`, and the
+installed herzog version. Stale notebooks are generated in this process, loading herzog once, or in parallel worker
+processes with `--jobs`. Notebooks are written atomically, and may be published directly to the destinations listed
+in their `publish.txt`.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple
+
+
+REPO_ROOT = os.environ.get("BDCAT_NOTEBOOKS_HOME",
+                           os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+CACHE_DIR = os.path.join(REPO_ROOT, ".notebook_cache")
+
+class BuildResult(NamedTuple):
+    notebook_dir: str
+    cache_key: str
+    hit: bool
+    duration: float
+
+def herzog_version() -> str:
+    try:
+        from importlib import metadata
+        return metadata.version("herzog")
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        return pkg_resources.get_distribution("herzog").version
+
+def cache_key(notebook_dir: str, herzog_ver: str) -> str:
+    """Hash the inputs that determine the content of a generated notebook."""
+    h = hashlib.sha256(herzog_ver.encode("utf-8"))
+    for filename in ("main.py", "requirements.txt"):
+        path = os.path.join(notebook_dir, filename)
+        h.update(filename.encode("utf-8"))
+        if os.path.isfile(path):
+            with open(path, "rb") as fh:
+                h.update(hashlib.sha256(fh.read()).digest())
+    return h.hexdigest()
+
+def render(herzog_script: str) -> str:
+    """Render a herzog script into the same text produced by the `herzog` CLI."""
+    import herzog
+    with open(herzog_script) as fh:
+        return json.dumps(herzog.generate(fh), indent=2) + "\n"
+
+def _render_to_cache(notebook_dir: str, key: str) -> BuildResult:
+    start = time.time()
+    content = render(os.path.join(notebook_dir, "main.py"))
+    tmp_path = os.path.join(CACHE_DIR, f"{key}.ipynb.{os.getpid()}")
+    with open(tmp_path, "w") as fh:
+        fh.write(content)
+    os.replace(tmp_path, os.path.join(CACHE_DIR, f"{key}.ipynb"))
+    return BuildResult(notebook_dir, key, False, time.time() - start)
+
+def _restore_from_cache(notebook_dir: str, key: str):
+    dst = os.path.join(notebook_dir, "notebook.ipynb")
+    cached = os.path.join(CACHE_DIR, f"{key}.ipynb")
+    if not _same_content(cached, dst):
+        tmp_path = f"{dst}.{os.getpid()}"
+        shutil.copyfile(cached, tmp_path)
+        os.replace(tmp_path, dst)
+
+def _same_content(a: str, b: str) -> bool:
+    if not os.path.isfile(b) or os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fh_a, open(b, "rb") as fh_b:
+        return fh_a.read() == fh_b.read()
+
+def build(notebook_dirs: Iterable[str], jobs: int=1) -> List[BuildResult]:
+    """Generate notebooks, rendering stale notebooks in this process if `jobs` is 1, otherwise in worker processes."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    herzog_ver = herzog_version()
+    results: Dict[str, BuildResult] = dict()
+    stale: Dict[str, str] = dict()
+    for nb_dir in notebook_dirs:
+        start = time.time()
+        key = cache_key(nb_dir, herzog_ver)
+        if os.path.isfile(os.path.join(CACHE_DIR, f"{key}.ipynb")):
+            _restore_from_cache(nb_dir, key)
+            results[nb_dir] = BuildResult(nb_dir, key, True, time.time() - start)
+        else:
+            stale[nb_dir] = key
+    if 1 == jobs:
+        for nb_dir, key in stale.items():
+            results[nb_dir] = _render_to_cache(nb_dir, key)
+            _restore_from_cache(nb_dir, key)
+    elif stale:
+        with ProcessPoolExecutor(max_workers=jobs) as e:
+            futures = {nb_dir: e.submit(_render_to_cache, nb_dir, key) for nb_dir, key in stale.items()}
+            for nb_dir, f in futures.items():
+                results[nb_dir] = f.result()
+                _restore_from_cache(nb_dir, stale[nb_dir])
+    return [results[nb_dir] for nb_dir in notebook_dirs]
+
+def print_report(results: List[BuildResult]):
+    for r in results:
+        print("%5s" % ("hit" if r.hit else "miss"), "%8.3fs" % r.duration, r.notebook_dir, file=sys.stderr)
+    hits = sum(1 for r in results if r.hit)
+    print(f"{hits} hits, {len(results) - hits} misses", file=sys.stderr)
+
+def publish_results(results: List[BuildResult], jobs: int=8, dry_run: bool=False):
+    """Publish generated notebooks to the destinations listed in their `publish.txt`, reading from the cache."""
+    import publish
+    contents: Dict[str, bytes] = dict()
+    pairs = list()
+    for r in results:
+        publish_directive = os.path.join(r.notebook_dir, "publish.txt")
+        if os.path.isfile(publish_directive):
+            notebook = os.path.join(r.notebook_dir, "notebook.ipynb")
+            with open(os.path.join(CACHE_DIR, f"{r.cache_key}.ipynb"), "rb") as fh:
+                contents[notebook] = fh.read()
+            pairs.append((notebook, publish_directive))
+    publish.print_report(publish.publish(publish.destinations_for(pairs), jobs, dry_run, contents))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook_dirs", nargs="*",
+                        help="notebook directories containing a herzog `main.py` (default: all notebooks)")
+    parser.add_argument("--attic", action="store_true", help="also generate the notebooks in attic/")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes. With 1, notebooks are generated in this process.")
+    parser.add_argument("--publish", action="store_true",
+                        help="publish generated notebooks to the destinations listed in their publish.txt")
+    parser.add_argument("--dry-run", action="store_true", help="with --publish, report changed notebooks only")
+    args = parser.parse_args()
+    notebook_dirs = args.notebook_dirs or sorted(glob.glob(os.path.join(REPO_ROOT, "notebooks", "*")))
+    if args.attic:
+        notebook_dirs += sorted(glob.glob(os.path.join(REPO_ROOT, "attic", "*")))
+    notebook_dirs = [os.path.normpath(d) for d in notebook_dirs]
+    for d in notebook_dirs:
+        if not os.path.isfile(os.path.join(d, "main.py")):
+            parser.error(f"{d}: No main.py found")
+    results = build(notebook_dirs, args.jobs)
+    print_report(results)
+    if args.publish:
+        publish_results(results, dry_run=args.dry_run)
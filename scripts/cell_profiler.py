@@ -0,0 +1,121 @@
+"""Profile the execution of herzog cells.
+
+When installed, each `herzog.Cell` context records wall time, CPU time, peak traced memory, and the source line span
+of the cell. Profiles are written as JSON, along with a text summary ranking cells by wall time.
+"""
+import os
+import ast
+import sys
+import json
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import herzog
+
+
+def cell_spans(notebook_path: str) -> Dict[int, Tuple[int, str]]:
+    """Map the first line of each herzog cell in `notebook_path` to the cell's last line and cell type."""
+    with open(notebook_path) as fh:
+        tree = ast.parse(fh.read(), notebook_path)
+    spans = dict()
+    statements = tree.body
+    for i, node in enumerate(statements):
+        if isinstance(node, ast.With):
+            for item in node.items:
+                call = item.context_expr
+                if (isinstance(call, ast.Call)
+                        and isinstance(call.func, ast.Attribute)
+                        and "Cell" == call.func.attr
+                        and call.args):
+                    # String literals are parsed as `ast.Str`, and `end_lineno` is unavailable, before Python 3.8
+                    cell_type = getattr(call.args[0], "value", getattr(call.args[0], "s", None))
+                    end_line = getattr(node, "end_lineno", None)
+                    if end_line is None:
+                        end_line = statements[i + 1].lineno - 1 if i + 1 < len(statements) else -1
+                    spans[node.lineno] = (end_line, cell_type)
+    return spans
+
+class CellProfiler:
+    def __init__(self, notebook_path: str):
+        self.notebook_path = os.path.abspath(notebook_path)
+        self.spans = cell_spans(self.notebook_path)
+        self.cells: List[Dict[str, Any]] = list()
+        self._started: Optional[Dict[str, Any]] = None
+        self._orig_enter = herzog.Cell.__enter__
+        self._orig_exit = herzog.Cell.__exit__
+
+    def install(self):
+        profiler = self
+
+        def __enter__(cell):
+            frame = sys._getframe(1)
+            in_notebook = os.path.abspath(frame.f_code.co_filename) == profiler.notebook_path
+            profiler.start_cell(frame.f_lineno if in_notebook else -1)
+            return profiler._orig_enter(cell)
+
+        def __exit__(cell, exc_type, *args, **kwargs):
+            profiler.end_cell(exc_type is None)
+            return profiler._orig_exit(cell, exc_type, *args, **kwargs)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        herzog.Cell.__enter__ = __enter__  # type: ignore
+        herzog.Cell.__exit__ = __exit__  # type: ignore
+
+    def uninstall(self):
+        herzog.Cell.__enter__ = self._orig_enter  # type: ignore
+        herzog.Cell.__exit__ = self._orig_exit  # type: ignore
+        tracemalloc.stop()
+
+    def start_cell(self, start_line: int):
+        end_line, cell_type = self.spans.get(start_line, (-1, "unknown"))
+        # `tracemalloc.reset_peak` is not available before Python 3.9
+        getattr(tracemalloc, "reset_peak", tracemalloc.clear_traces)()
+        self._started = dict(start_line=start_line,
+                             end_line=end_line,
+                             cell_type=cell_type,
+                             traced_memory=tracemalloc.get_traced_memory()[0],
+                             wall=time.perf_counter(),
+                             cpu=time.process_time())
+
+    def end_cell(self, succeeded: bool):
+        wall, cpu = time.perf_counter(), time.process_time()
+        peak_traced_memory = tracemalloc.get_traced_memory()[1]
+        s = self._started
+        if s is None:
+            return
+        self.cells.append(dict(index=len(self.cells),
+                               cell_type=s['cell_type'],
+                               start_line=s['start_line'],
+                               end_line=s['end_line'],
+                               wall_time=wall - s['wall'],
+                               cpu_time=cpu - s['cpu'],
+                               peak_traced_memory_mb=max(0, peak_traced_memory - s['traced_memory']) / 1024 ** 2,
+                               succeeded=succeeded))
+        self._started = None
+
+    def profile(self) -> Dict[str, Any]:
+        return dict(notebook=self.notebook_path,
+                    total_wall_time=sum(c['wall_time'] for c in self.cells),
+                    total_cpu_time=sum(c['cpu_time'] for c in self.cells),
+                    cells=self.cells)
+
+    def summary(self, limit: int=20) -> str:
+        lines = [f"{self.notebook_path}: {len(self.cells)} cells, "
+                 f"{self.profile()['total_wall_time']:.2f}s wall time",
+                 "%5s %10s %10s %12s %s" % ("cell", "wall", "cpu", "peak_traced", "lines")]
+        for c in sorted(self.cells, key=lambda c: c['wall_time'], reverse=True)[:limit]:
+            span = f"{c['start_line']}-{c['end_line']}" + ("" if c['succeeded'] else " (failed)")
+            row = (c['index'], c['wall_time'], c['cpu_time'], c['peak_traced_memory_mb'], span)
+            lines.append("%5i %9.3fs %9.3fs %10.1fMB %s" % row)
+        return os.linesep.join(lines)
+
+    def write(self, output_dir: str):
+        """Write `{notebook}.profile.json` and `{notebook}.profile.txt` into `output_dir`."""
+        os.makedirs(output_dir, exist_ok=True)
+        name = os.path.basename(os.path.dirname(self.notebook_path))
+        with open(os.path.join(output_dir, f"{name}.profile.json"), "w") as fh:
+            json.dump(self.profile(), fh, indent=2)
+        with open(os.path.join(output_dir, f"{name}.profile.txt"), "w") as fh:
+            fh.write(self.summary(limit=len(self.cells)) + os.linesep)
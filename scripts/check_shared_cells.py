@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Verify that cells shared between notebooks have not drifted apart.
+
+Notebooks are published standalone, so helpers used by several notebooks are copied into each of them. A copied
+cell is marked by a `# shared-cell: <name>` comment on the line preceding its `with herzog.Cell(...)` statement.
+Comments outside cells are not published. Every copy of a named cell must be identical.
+"""
+import os
+import re
+import sys
+import ast
+import glob
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+REPO_ROOT = os.environ.get("BDCAT_NOTEBOOKS_HOME",
+                           os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+MARKER = re.compile(r"^# shared-cell: (\S+)\s*$")
+
+def shared_cells(notebook_path: str) -> Dict[str, List[str]]:
+    """Map each shared cell name in `notebook_path` to the source of the cells marked with it, in order."""
+    with open(notebook_path) as fh:
+        src = fh.read()
+    lines = src.splitlines()
+    cells: Dict[str, List[str]] = defaultdict(list)
+    for node in ast.parse(src, notebook_path).body:
+        if isinstance(node, ast.With) and 1 < node.lineno:
+            m = MARKER.match(lines[node.lineno - 2])
+            if m:
+                cells[m.group(1)].append("\n".join(lines[node.lineno - 1:node.end_lineno]))
+    return cells
+
+def check(notebook_paths: List[str]) -> List[str]:
+    copies: Dict[str, List[Tuple[str, List[str]]]] = defaultdict(list)
+    for path in notebook_paths:
+        for name, cells in shared_cells(path).items():
+            copies[name].append((path, cells))
+    errors = list()
+    for name, found in sorted(copies.items()):
+        reference_path, reference = found[0]
+        if 1 == len(found):
+            errors.append(f"shared cell '{name}' only appears in {reference_path}")
+        for path, cells in found[1:]:
+            if cells != reference:
+                errors.append(f"shared cell '{name}' differs between {reference_path} and {path}")
+    return errors
+
+if __name__ == "__main__":
+    notebook_paths = sorted(glob.glob(os.path.join(REPO_ROOT, "notebooks", "*", "main.py")))
+    errors = check(notebook_paths)
+    for error in errors:
+        print(error, file=sys.stderr)
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+"""A local stand-in for the Firecloud entity API and Google Storage, backed by SQLite.
+
+Implements the Firecloud/Rawls entity endpoints used by notebooks (list entity types, get entities, entity query,
+flexible import, update, batch upsert, and delete), and the Google Storage JSON API object operations (get, list,
+media, multipart, and resumable uploads, ranged downloads, and delete). Every request may be delayed to emulate network
+latency for benchmarking.
+
+Run standalone with `scripts/fake_terra.py --port 9025`, then point notebooks at it with FAKE_TERRA_URL. Notebooks
+executed with `scripts/run_notebook.py` and FAKE_TERRA_DB start an in-process stand-in instead.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+
+class FakeTerraError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+class Store:
+    """SQLite storage for entities and objects. A single connection is shared, and serialized, across threads."""
+    def __init__(self, db_path: str=":memory:"):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entities ("
+                               "namespace TEXT, workspace TEXT, etype TEXT, name TEXT, attributes TEXT, "
+                               "PRIMARY KEY (namespace, workspace, etype, name))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS objects ("
+                               "bucket TEXT, name TEXT, data BLOB, content_type TEXT, generation INTEGER, "
+                               "updated TEXT, PRIMARY KEY (bucket, name))")
+
+    def execute(self, sql: str, params: tuple=()) -> List[tuple]:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_entity(self, ns: str, ws: str, etype: str, name: str) -> Optional[Dict[str, Any]]:
+        rows = self.execute("SELECT attributes FROM entities WHERE namespace=? AND workspace=? AND etype=? AND name=?",
+                            (ns, ws, etype, name))
+        return json.loads(rows[0][0]) if rows else None
+
+    def put_entity(self, ns: str, ws: str, etype: str, name: str, attributes: Dict[str, Any]):
+        self.execute("INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?)",
+                     (ns, ws, etype, name, json.dumps(attributes)))
+
+    def list_entities(self, ns: str, ws: str, etype: str) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self.execute("SELECT name, attributes FROM entities WHERE namespace=? AND workspace=? AND etype=? "
+                            "ORDER BY name", (ns, ws, etype))
+        return [(name, json.loads(attributes)) for name, attributes in rows]
+
+    def entity_types(self, ns: str, ws: str) -> List[str]:
+        return [r[0] for r in self.execute("SELECT DISTINCT etype FROM entities WHERE namespace=? AND workspace=?",
+                                           (ns, ws))]
+
+    def delete_entity(self, ns: str, ws: str, etype: str, name: str) -> bool:
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM entities WHERE namespace=? AND workspace=? AND etype=? AND name=?",
+                                     (ns, ws, etype, name))
+            return 0 < cur.rowcount
+
+    def get_object(self, bucket: str, name: str) -> Optional[tuple]:
+        rows = self.execute("SELECT data, content_type, generation, updated FROM objects WHERE bucket=? AND name=?",
+                            (bucket, name))
+        return rows[0] if rows else None
+
+    def put_object(self, bucket: str, name: str, data: bytes, content_type: str) -> int:
+        generation = time.time_ns() // 1000
+        updated = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        self.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+                     (bucket, name, data, content_type, generation, updated))
+        return generation
+
+    def list_objects(self, bucket: str, prefix: str, start_after: str, limit: int) -> List[tuple]:
+        return self.execute("SELECT name, data, content_type, generation, updated FROM objects "
+                            "WHERE bucket=? AND name > ? AND substr(name, 1, ?)=? ORDER BY name LIMIT ?",
+                            (bucket, start_after, len(prefix), prefix, limit))
+
+    def delete_object(self, bucket: str, name: str) -> bool:
+        with self._lock, self._conn:
+            return 0 < self._conn.execute("DELETE FROM objects WHERE bucket=? AND name=?", (bucket, name)).rowcount
+
+def _object_resource(bucket: str, name: str, data: bytes, content_type: str, generation: int, updated: str) -> dict:
+    resource = dict(kind="storage#object",
+                    id=f"{bucket}/{name}/{generation}",
+                    bucket=bucket,
+                    name=name,
+                    size=str(len(data)),
+                    contentType=content_type,
+                    generation=str(generation),
+                    metageneration="1",
+                    timeCreated=updated,
+                    updated=updated,
+                    md5Hash=base64.b64encode(hashlib.md5(data).digest()).decode("utf-8"))
+    if google_crc32c is not None:
+        resource['crc32c'] = base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode("utf-8")
+    return resource
+
+def _entity_resource(etype: str, name: str, attributes: Dict[str, Any]) -> dict:
+    return dict(name=name, entityType=etype, attributes=attributes)
+
+def _list_attribute(items: list) -> dict:
+    return dict(itemsType="AttributeValue", items=items)
+
+def _apply_operations(attributes: Dict[str, Any], operations: List[dict]):
+    """Apply Firecloud entity update operations to `attributes`."""
+    for op in operations:
+        if "AddUpdateAttribute" == op['op']:
+            attributes[op['attributeName']] = op['addUpdateAttribute']
+        elif "RemoveAttribute" == op['op']:
+            attributes.pop(op['attributeName'], None)
+        elif "CreateAttributeValueList" == op['op']:
+            attributes[op['attributeName']] = _list_attribute(list())
+        elif "AddListMember" == op['op']:
+            val = attributes.get(op['attributeListName'])
+            if not (isinstance(val, dict) and "items" in val):
+                val = attributes[op['attributeListName']] = _list_attribute(list())
+            val['items'].append(op['newMember'])
+        elif "RemoveListMember" == op['op']:
+            val = attributes.get(op['attributeListName'], dict())
+            if op['removeMember'] in val.get("items", list()):
+                val['items'].remove(op['removeMember'])
+        else:
+            raise FakeTerraError(400, f"Unsupported update operation '{op['op']}'")
+
+class Handler(BaseHTTPRequestHandler):
+    store: Store
+    latency: float = 0.0
+    jitter: float = 0.0
+    verbose: bool = False
+    _resumable_uploads: Dict[str, Dict[str, Any]] = dict()
+    _routes: List[Tuple[str, "re.Pattern", str]] = list()
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        if self.verbose:
+            super().log_message(*args)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, code: int, body: Any=None, content_type: str="application/json", headers: Dict[str, str]=None):
+        if isinstance(body, (dict, list)):
+            data = json.dumps(body).encode("utf-8")
+        elif body is None:
+            data = b""
+        else:
+            data = body
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            for route_method, pattern, handler_name in self._routes:
+                match = pattern.fullmatch(url.path)
+                if route_method == method and match:
+                    args = [unquote(g) for g in match.groups()]
+                    return getattr(self, handler_name)(*args, query=query)
+            raise FakeTerraError(404, f"No route for {method} {url.path}")
+        except FakeTerraError as e:
+            self._send(e.code, dict(error=dict(code=e.code, message=str(e))))
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # Firecloud entity API
+
+    def list_entity_types(self, ns: str, ws: str, query: dict):
+        types = dict()
+        for etype in self.store.entity_types(ns, ws):
+            rows = self.store.list_entities(ns, ws, etype)
+            names = sorted({k for _, attributes in rows for k in attributes})
+            types[etype] = dict(attributeNames=names, count=len(rows), idName=f"{etype}_id")
+        self._send(200, types)
+
+    def get_entities(self, ns: str, ws: str, etype: str, query: dict):
+        self._send(200, [_entity_resource(etype, name, attributes)
+                         for name, attributes in self.store.list_entities(ns, ws, etype)])
+
+    def get_entity(self, ns: str, ws: str, etype: str, name: str, query: dict):
+        attributes = self.store.get_entity(ns, ws, etype, name)
+        if attributes is None:
+            raise FakeTerraError(404, f"{etype} {name} does not exist in {ns}/{ws}")
+        self._send(200, _entity_resource(etype, name, attributes))
+
+    def entity_query(self, ns: str, ws: str, etype: str, query: dict):
+        page, page_size = int(query.get("page", 1)), int(query.get("pageSize", 100))
+        rows = self.store.list_entities(ns, ws, etype)
+        unfiltered_count = len(rows)
+        if query.get("filterTerms"):
+            terms = query['filterTerms'].lower().split()
+            rows = [(name, attributes) for name, attributes in rows
+                    if all(t in (name + json.dumps(attributes)).lower() for t in terms)]
+        if "desc" == query.get("sortDirection", "asc"):
+            rows.reverse()
+        results = [_entity_resource(etype, name, attributes)
+                   for name, attributes in rows[(page - 1) * page_size:page * page_size]]
+        self._send(200, dict(parameters=dict(page=page, pageSize=page_size),
+                             resultMetadata=dict(unfilteredCount=unfiltered_count,
+                                                 filteredCount=len(rows),
+                                                 filteredPageCount=max(1, -(-len(rows) // page_size))),
+                             results=results))
+
+    def import_entities(self, ns: str, ws: str, query: dict):
+        form = parse_qs(self._body().decode("utf-8"))
+        if "entities" not in form:
+            raise FakeTerraError(400, "Expected form field 'entities'")
+        lines = form['entities'][0].splitlines()
+        header = lines[0].split("\t")
+        etype = re.sub(r"^(entity|membership|update):", "", header[0])
+        if not etype.endswith("_id"):
+            raise FakeTerraError(400, f"Invalid entity id column '{header[0]}'")
+        etype = etype[:-len("_id")]
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, *values = line.split("\t")
+            attributes = self.store.get_entity(ns, ws, etype, name) or dict()
+            attributes.update({k: v for k, v in zip(header[1:], values)})
+            self.store.put_entity(ns, ws, etype, name, attributes)
+        self._send(200, b"", "text/plain")
+
+    def update_entity(self, ns: str, ws: str, etype: str, name: str, query: dict):
+        attributes = self.store.get_entity(ns, ws, etype, name)
+        if attributes is None:
+            raise FakeTerraError(404, f"{etype} {name} does not exist in {ns}/{ws}")
+        _apply_operations(attributes, json.loads(self._body()))
+        self.store.put_entity(ns, ws, etype, name, attributes)
+        self._send(200, _entity_resource(etype, name, attributes))
+
+    def batch_upsert(self, ns: str, ws: str, query: dict):
+        for entity in json.loads(self._body()):
+            attributes = self.store.get_entity(ns, ws, entity['entityType'], entity['name']) or dict()
+            _apply_operations(attributes, entity['operations'])
+            self.store.put_entity(ns, ws, entity['entityType'], entity['name'], attributes)
+        self._send(204)
+
+    def delete_entities(self, ns: str, ws: str, query: dict):
+        missing = [e for e in json.loads(self._body())
+                   if not self.store.delete_entity(ns, ws, e['entityType'], e['entityName'])]
+        if missing:
+            raise FakeTerraError(400, f"Entities not found: {missing}")
+        self._send(204)
+
+    # Google Storage JSON API
+
+    def get_bucket(self, bucket: str, query: dict):
+        self._send(200, dict(kind="storage#bucket", id=bucket, name=bucket))
+
+    def get_object(self, bucket: str, name: str, query: dict):
+        obj = self.store.get_object(bucket, name)
+        if obj is None:
+            raise FakeTerraError(404, f"No such object: {bucket}/{name}")
+        data, content_type, generation, updated = obj
+        if "media" != query.get("alt"):
+            return self._send(200, _object_resource(bucket, name, data, content_type, generation, updated))
+        headers = {"x-goog-generation": str(generation), "Accept-Ranges": "bytes"}
+        m = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+            else:
+                start, end = max(0, len(data) - int(m.group(2))), len(data) - 1
+            if start >= len(data):
+                raise FakeTerraError(416, "Requested range not satisfiable")
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return self._send(206, data[start:end + 1], content_type, headers)
+        self._send(200, data, content_type, headers)
+
+    def list_objects(self, bucket: str, query: dict):
+        prefix, delimiter = query.get("prefix", ""), query.get("delimiter")
+        limit = int(query.get("maxResults", 1000))
+        items: List[dict] = list()
+        prefixes: List[str] = list()
+        start_after = query.get("pageToken", "")
+        rows = self.store.list_objects(bucket, prefix, start_after, limit + 1)
+        for name, data, content_type, generation, updated in rows[:limit]:
+            if delimiter and delimiter in name[len(prefix):]:
+                pfx = name[:len(prefix) + name[len(prefix):].index(delimiter) + len(delimiter)]
+                if pfx not in prefixes:
+                    prefixes.append(pfx)
+            else:
+                items.append(_object_resource(bucket, name, data, content_type, generation, updated))
+        resp: Dict[str, Any] = dict(kind="storage#objects", items=items, prefixes=prefixes)
+        if len(rows) > limit:
+            resp['nextPageToken'] = rows[limit - 1][0]
+        self._send(200, resp)
+
+    def delete_object(self, bucket: str, name: str, query: dict):
+        if not self.store.delete_object(bucket, name):
+            raise FakeTerraError(404, f"No such object: {bucket}/{name}")
+        self._send(204)
+
+    def _finish_upload(self, bucket: str, name: str, data: bytes, metadata: dict):
+        if "md5Hash" in metadata:
+            if metadata['md5Hash'] != base64.b64encode(hashlib.md5(data).digest()).decode("utf-8"):
+                raise FakeTerraError(400, "Provided MD5 hash does not match uploaded data")
+        content_type = metadata.get("contentType") or "application/octet-stream"
+        generation = self.store.put_object(bucket, name, data, content_type)
+        obj = self.store.get_object(bucket, name)
+        self._send(200, _object_resource(bucket, name, data, content_type, generation, obj[3]))
+
+    def upload_object(self, bucket: str, query: dict):
+        upload_type = query.get("uploadType", "media")
+        body = self._body()
+        if "media" == upload_type:
+            if "name" not in query:
+                raise FakeTerraError(400, "Expected 'name' query parameter")
+            self._finish_upload(bucket, query['name'], body, dict(contentType=self.headers.get("Content-Type")))
+        elif "multipart" == upload_type:
+            boundary = re.search(r"boundary=\"?([^\";]+)", self.headers.get("Content-Type", ""))
+            if boundary is None:
+                raise FakeTerraError(400, "Expected multipart boundary")
+            parts = body.split(b"--" + boundary.group(1).encode("utf-8"))[1:-1]
+            # Each part is framed by a single CRLF on either side, which must not be stripped from the data
+            (_, metadata_part), (part_headers, data) = [p[2:-2].split(b"\r\n\r\n", 1) for p in parts]
+            metadata = json.loads(metadata_part)
+            content_type = re.search(rb"content-type:\s*(\S+)", part_headers, re.IGNORECASE)
+            if content_type and "contentType" not in metadata:
+                metadata['contentType'] = content_type.group(1).decode("utf-8")
+            name = metadata.get("name") or query.get("name")
+            self._finish_upload(bucket, name, data, metadata)
+        elif "resumable" == upload_type:
+            metadata = json.loads(body) if body else dict()
+            metadata.setdefault("name", query.get("name"))
+            upload_id = uuid.uuid4().hex
+            self._resumable_uploads[upload_id] = dict(bucket=bucket, metadata=metadata, data=b"")
+            location = (f"http://{self.headers['Host']}/upload/storage/v1/b/{quote(bucket, safe='')}/o"
+                        f"?uploadType=resumable&upload_id={upload_id}")
+            self._send(200, dict(), headers=dict(Location=location))
+        else:
+            raise FakeTerraError(400, f"Unsupported uploadType '{upload_type}'")
+
+    def resume_upload(self, bucket: str, query: dict):
+        upload = self._resumable_uploads.get(query.get("upload_id", ""))
+        if upload is None:
+            raise FakeTerraError(404, "No such upload")
+        upload['data'] += self._body()
+        m = re.fullmatch(r"bytes (?:\d+-\d+|\*)/(\d+|\*)", self.headers.get("Content-Range", "bytes */*"))
+        total = m.group(1) if m else "*"
+        if "*" != total and int(total) == len(upload['data']):
+            del self._resumable_uploads[query['upload_id']]
+            self._finish_upload(upload['bucket'], upload['metadata']['name'], upload['data'], upload['metadata'])
+        else:
+            self._send(308, headers=dict(Range=f"bytes=0-{len(upload['data']) - 1}"))
+
+def _route(method: str, pattern: str, handler: Callable):
+    Handler._routes.append((method, re.compile(pattern), handler.__name__))
+
+_WS = r"/api/workspaces/([^/]+)/([^/]+)"
+_route("GET", _WS + r"/entities", Handler.list_entity_types)
+_route("GET", _WS + r"/entities/([^/]+)", Handler.get_entities)
+_route("GET", _WS + r"/entities/([^/]+)/([^/]+)", Handler.get_entity)
+_route("PATCH", _WS + r"/entities/([^/]+)/([^/]+)", Handler.update_entity)
+_route("POST", _WS + r"/entities/delete", Handler.delete_entities)
+_route("POST", _WS + r"/entities/batchUpsert", Handler.batch_upsert)
+_route("GET", _WS + r"/entityQuery/([^/]+)", Handler.entity_query)
+_route("POST", _WS + r"/(?:flexibleImportEntities|importEntities)", Handler.import_entities)
+_route("GET", r"/storage/v1/b/([^/]+)", Handler.get_bucket)
+_route("GET", r"/storage/v1/b/([^/]+)/o", Handler.list_objects)
+_route("GET", r"/(?:download/)?storage/v1/b/([^/]+)/o/(.+)", Handler.get_object)
+_route("DELETE", r"/storage/v1/b/([^/]+)/o/(.+)", Handler.delete_object)
+_route("POST", r"/upload/storage/v1/b/([^/]+)/o", Handler.upload_object)
+_route("PUT", r"/upload/storage/v1/b/([^/]+)/o", Handler.resume_upload)
+
+def serve(host: str="localhost",
+          port: int=0,
+          db_path: str=":memory:",
+          latency: float=0.0,
+          jitter: float=0.0,
+          verbose: bool=False) -> ThreadingHTTPServer:
+    """Start a stand-in server in a background thread. Latency and jitter are in seconds."""
+    handler = type("FakeTerraHandler", (Handler,), dict(store=Store(db_path),
+                                                        latency=latency,
+                                                        jitter=jitter,
+                                                        verbose=verbose,
+                                                        _resumable_uploads=dict()))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+def configure_clients(url: str):
+    """Direct the Firecloud API client and Google Storage clients to the stand-in at `url`."""
+    import requests
+    from firecloud import api as fapi
+    os.environ['STORAGE_EMULATOR_HOST'] = url
+    fapi.fcconfig.root_url = url.rstrip("/") + "/api/"
+    # Replace the authorized session, which requires Google credentials, with an anonymous session
+    fapi.__SESSION = requests.Session()
+
+def configure_from_environment() -> Optional[ThreadingHTTPServer]:
+    """Configure clients from FAKE_TERRA_URL, or start an in-process stand-in if FAKE_TERRA_DB is set."""
+    server = None
+    url = os.environ.get("FAKE_TERRA_URL")
+    if not url and os.environ.get("FAKE_TERRA_DB"):
+        server = serve(db_path=os.environ['FAKE_TERRA_DB'],
+                       latency=float(os.environ.get("FAKE_TERRA_LATENCY_MS", 0)) / 1000,
+                       jitter=float(os.environ.get("FAKE_TERRA_JITTER_MS", 0)) / 1000)
+        url = os.environ['FAKE_TERRA_URL'] = server_url(server)
+    if url:
+        configure_clients(url)
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9025)
+    parser.add_argument("--db", default=":memory:", help="SQLite database path")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="maximum random delay added to every request")
+    parser.add_argument("--verbose", action="store_true", help="log requests")
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.db, args.latency_ms / 1000, args.jitter_ms / 1000, args.verbose)
+    print(f"Serving Firecloud and Google Storage stand-in on {server_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
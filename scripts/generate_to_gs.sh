@@ -25,5 +25,4 @@ if [[ ! -f ${herzog_script} ]]; then
     exit 1
 fi
 
-herzog "${herzog_script}" > notebook.ipynb
-gsutil cp notebook.ipynb "${gs_dest}" || echo "Unable to publish to ${gs_dest}"
+herzog "${herzog_script}" | gsutil cp - "${gs_dest}" || echo "Unable to publish to ${gs_dest}"
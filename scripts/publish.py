@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Publish generated notebooks to the Google Storage destinations listed in their publish directive files.
+
+Arguments are pairs of notebook `.ipynb` files and publish directive files. A publish directive file contains lines
+specifying Google Storage destinations of the notebook: gs://bucket_name/pfx/notebook_name.ipynb
+The GS url may contain spaces. Text after "#" in any line is ignored.
+
+Local MD5 (or CRC32C, for objects without an MD5) checksums are compared with remote object metadata, and only
+notebooks that differ from their destination are uploaded. Uploads are performed concurrently over a shared
+connection pool. Set STORAGE_EMULATOR_HOST to publish to a local fake-GCS stand-in.
+"""
+import os
+import sys
+import base64
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+
+class Destination(NamedTuple):
+    notebook: str
+    url: str
+
+class PublishResult(NamedTuple):
+    destination: Destination
+    status: str  # "uploaded", "unchanged", "dry-run", or "failed"
+
+def read_publish_directive(path: str) -> List[str]:
+    urls = list()
+    with open(path) as fh:
+        for line in fh:
+            url = line.split("#", 1)[0].strip()
+            if url:
+                urls.append(url)
+    return urls
+
+def parse_gs_url(url: str) -> Tuple[str, str]:
+    if not url.startswith("gs://"):
+        raise ValueError(f"Expected a Google Storage url, got '{url}'")
+    bucket_name, _, key = url[len("gs://"):].partition("/")
+    if not key:
+        raise ValueError(f"Expected a Google Storage object url, got '{url}'")
+    return bucket_name, key
+
+def md5(data: bytes) -> str:
+    """Base64 encoded MD5, as reported by Google Storage object metadata."""
+    return base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+
+def crc32c(data: bytes) -> Optional[str]:
+    """Base64 encoded big-endian CRC32C, as reported by Google Storage object metadata."""
+    if google_crc32c is None:
+        return None
+    return base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode("utf-8")
+
+def get_client(max_connections: int):
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+    if os.environ.get("STORAGE_EMULATOR_HOST"):
+        from google.auth.credentials import AnonymousCredentials
+        client = storage.Client(credentials=AnonymousCredentials(), project="local")
+    else:
+        client = storage.Client()
+    # Size the connection pool to match upload concurrency so that connections are reused across uploads.
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    client._http.mount("https://", adapter)
+    client._http.mount("http://", adapter)
+    return client
+
+class Publisher:
+    def __init__(self, client, dry_run: bool=False):
+        self.client = client
+        self.dry_run = dry_run
+        self._contents: dict = dict()
+
+    def add(self, notebook: str, data: bytes):
+        """Provide the content of `notebook` from memory, instead of reading it from disk."""
+        self._contents[notebook] = (data, md5(data), crc32c(data))
+
+    def _load(self, notebook: str) -> Tuple[bytes, str, Optional[str]]:
+        if notebook not in self._contents:
+            with open(notebook, "rb") as fh:
+                data = fh.read()
+            self._contents[notebook] = (data, md5(data), crc32c(data))
+        return self._contents[notebook]
+
+    def is_unchanged(self, dst: Destination) -> bool:
+        _, local_md5, local_crc32c = self._load(dst.notebook)
+        bucket_name, key = parse_gs_url(dst.url)
+        blob = self.client.bucket(bucket_name).get_blob(key)
+        if blob is None:
+            return False
+        elif blob.md5_hash:
+            return local_md5 == blob.md5_hash
+        elif blob.crc32c and local_crc32c:
+            return local_crc32c == blob.crc32c
+        return False
+
+    def publish(self, dst: Destination) -> PublishResult:
+        try:
+            if self.is_unchanged(dst):
+                return PublishResult(dst, "unchanged")
+            elif self.dry_run:
+                return PublishResult(dst, "dry-run")
+            data, local_md5, _ = self._load(dst.notebook)
+            bucket_name, key = parse_gs_url(dst.url)
+            blob = self.client.bucket(bucket_name).blob(key)
+            blob.md5_hash = local_md5  # Verified server side
+            blob.upload_from_string(data, content_type="application/x-ipynb+json")
+            return PublishResult(dst, "uploaded")
+        except Exception as e:
+            print(f"Unable to publish to {dst.url}: {e}", file=sys.stderr)
+            return PublishResult(dst, "failed")
+
+def publish(destinations: Sequence[Destination],
+            jobs: int=8,
+            dry_run: bool=False,
+            contents: Optional[Dict[str, bytes]]=None) -> List[PublishResult]:
+    """Publish notebooks to `destinations`. Notebooks present in `contents` are published from memory."""
+    publisher = Publisher(get_client(jobs), dry_run)
+    for notebook, data in (contents or dict()).items():
+        publisher.add(notebook, data)
+    for notebook in {dst.notebook for dst in destinations}:
+        publisher._load(notebook)  # Read and checksum notebooks before dispatching threads
+    with ThreadPoolExecutor(max_workers=jobs) as e:
+        return list(e.map(publisher.publish, destinations))
+
+def destinations_for(pairs: Iterable[Tuple[str, str]]) -> List[Destination]:
+    destinations = list()
+    for notebook, publish_directive in pairs:
+        for url in read_publish_directive(publish_directive):
+            # As with `gsutil cp`, bucket and prefix urls receive the notebook under its own file name
+            if url.endswith("/") or "/" not in url[len("gs://"):]:
+                url = url.rstrip("/") + "/" + os.path.basename(notebook)
+            destinations.append(Destination(notebook, url))
+    return destinations
+
+def print_report(results: List[PublishResult]):
+    for r in results:
+        print("%9s" % r.status, r.destination.url, file=sys.stderr)
+    counts = {status: sum(1 for r in results if status == r.status)
+              for status in ("uploaded", "unchanged", "dry-run", "failed")}
+    print(", ".join(f"{n} {status}" for status, n in counts.items() if n), file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", metavar="notebook_ipynb publish_directive",
+                        help="pairs of notebook .ipynb files and publish directive files")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="number of concurrent uploads")
+    parser.add_argument("--dry-run", action="store_true", help="report changed notebooks without uploading")
+    args = parser.parse_args()
+    if len(args.paths) % 2:
+        parser.error("Expected pairs of notebook .ipynb files and publish directive files")
+    pairs = list(zip(args.paths[::2], args.paths[1::2]))
+    for path in args.paths:
+        if not os.path.isfile(path):
+            parser.error(f"{path}: No such file")
+    print_report(publish(destinations_for(pairs), args.jobs, args.dry_run))
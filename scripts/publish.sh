@@ -29,9 +29,4 @@ if [[ ! -f ${publish_directive} ]]; then
 
 fi
 
-while read line; do
-    gs_dest=$(echo -n ${line} | cut -d'#' -f1)
-    if [[ ! -z "${gs_dest}" ]]; then
-        gsutil cp "${notebook_ipynb}" "${gs_dest}" || echo "Unable to publish to ${gs_dest}"
-    fi
-done < ${publish_directive}
+"$(dirname "$0")/publish.py" "${notebook_ipynb}" "${publish_directive}"
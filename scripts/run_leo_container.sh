@@ -3,6 +3,12 @@ function usage() {
     echo 'Given a notebook name, launch the Docker image configered in'
     echo '`notebooks/${NOTEBOOK_NAME}/leo_config`, install requirements,'
     echo 'and execute the notebook. '
+    echo ''
+    echo 'If LEO_CONTAINER_POOL is set to a non-empty value, one warm container is kept'
+    echo 'per distinct LEO_IMAGE and reused across notebooks. Requirements missing from'
+    echo 'the image are installed into a virtualenv layered over the image'"'"'s packages,'
+    echo 'keyed by the hash of `requirements.txt`, which is reused by subsequent runs'
+    echo 'with identical requirements.'
 }
 if [[ $# != 1 ]]; then
     usage
@@ -13,21 +19,71 @@ set -euo pipefail
 
 NOTEBOOK=$1
 CONTAINER=${NOTEBOOK}
+REQUIREMENTS=notebooks/${NOTEBOOK}/requirements.txt
 
 if [[ -e ${BDCAT_NOTEBOOKS_HOME}/notebooks/${NOTEBOOK}/leo_config ]]; then
     source ${BDCAT_NOTEBOOKS_HOME}/notebooks/${NOTEBOOK}/leo_config
 fi
 
-docker kill $1 1>&2 || :
-docker rm $1 1>&2 || :
-docker pull ${LEO_IMAGE} 1>&2
-wid=$(docker run \
-  -v ${BDCAT_NOTEBOOKS_HOME}:${LEO_REPO_DIR} \
-  -v ~/.config:/home/jupyter-user/.config \
-  --name "${CONTAINER}" \
-  -it -d \
-  ${LEO_IMAGE})
-echo -n ${wid}
-
-docker exec ${CONTAINER} bash -c "${LEO_PIP} install --upgrade -r ${LEO_REPO_DIR}/notebooks/${NOTEBOOK}/requirements.txt"
-docker exec ${CONTAINER} ${LEO_PYTHON} "${LEO_REPO_DIR}/notebooks/${NOTEBOOK}/main.py"
+function short_hash() {
+    if command -v sha256sum > /dev/null; then
+        sha256sum | cut -c1-16
+    else
+        shasum -a 256 | cut -c1-16
+    fi
+}
+
+function container_running() {
+    [[ -n "$(docker ps -q -f name="^${1}$")" ]]
+}
+
+function start_container() {
+    docker run \
+      -v ${BDCAT_NOTEBOOKS_HOME}:${LEO_REPO_DIR} \
+      -v ~/.config:/home/jupyter-user/.config \
+      --name "$1" \
+      "${@:2}" \
+      -it -d \
+      ${LEO_IMAGE}
+}
+
+# Notebooks run in the image's working directory, so relative profile directories are resolved against the
+# repository, which is mounted into the container
+if [[ -n "${HERZOG_PROFILE:-}" && "${HERZOG_PROFILE}" != /* ]]; then
+    HERZOG_PROFILE=${LEO_REPO_DIR}/${HERZOG_PROFILE}
+fi
+
+if [[ -z "${LEO_CONTAINER_POOL:-}" ]]; then
+    docker kill ${CONTAINER} 1>&2 || :
+    docker rm ${CONTAINER} 1>&2 || :
+    docker pull ${LEO_IMAGE} 1>&2
+    wid=$(start_container "${CONTAINER}")
+    echo -n ${wid}
+
+    docker exec ${CONTAINER} bash -c "${LEO_PIP} install --upgrade -r ${LEO_REPO_DIR}/${REQUIREMENTS}"
+    docker exec -e HERZOG_PROFILE ${CONTAINER} \
+        ${LEO_PYTHON} ${LEO_REPO_DIR}/scripts/run_notebook.py "${LEO_REPO_DIR}/notebooks/${NOTEBOOK}/main.py"
+else
+    CONTAINER=leo-pool-$(echo -n "${LEO_IMAGE}" | short_hash)
+    if ! container_running ${CONTAINER}; then
+        docker rm ${CONTAINER} 1>&2 || :
+        docker pull ${LEO_IMAGE} 1>&2
+        # Another concurrent invocation may win the race to create the container
+        start_container "${CONTAINER}" --label leo-pool 1>&2 || container_running ${CONTAINER}
+    fi
+    echo -n ${CONTAINER}
+
+    venv_dir=${LEO_USER_HOME}/.leo-pool/venv-$(short_hash < ${BDCAT_NOTEBOOKS_HOME}/${REQUIREMENTS})
+    if ! docker exec ${CONTAINER} test -e ${venv_dir}/.complete; then
+        # The virtualenv sees the image's site-packages, and pip only installs requirements the image does not
+        # satisfy, so notebooks run against the image's package set. It is built in a private directory, then moved
+        # into place unless a concurrent invocation already has. Only its python is used, which may be moved.
+        tmp_dir=${venv_dir}.tmp.$$
+        docker exec ${CONTAINER} bash -c "${LEO_PYTHON} -m venv --system-site-packages ${tmp_dir} \
+                                          && ${tmp_dir}/bin/python -m pip install -r ${LEO_REPO_DIR}/${REQUIREMENTS} \
+                                          && touch ${tmp_dir}/.complete \
+                                          && (mv -T ${tmp_dir} ${venv_dir} 2> /dev/null || rm -rf ${tmp_dir})"
+    fi
+    docker exec -e HERZOG_PROFILE ${CONTAINER} \
+        ${venv_dir}/bin/python ${LEO_REPO_DIR}/scripts/run_notebook.py "${LEO_REPO_DIR}/notebooks/${NOTEBOOK}/main.py"
+fi
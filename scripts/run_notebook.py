@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Execute a herzog notebook source script, applying opt-in instrumentation configured through the environment.
+
+Environment variables:
+  HERZOG_PROFILE: directory where a per-cell execution profile of the notebook is written
+  FAKE_TERRA_URL: direct Firecloud and Google Storage requests to a stand-in started with `scripts/fake_terra.py`
+  FAKE_TERRA_DB: start an in-process Firecloud and Google Storage stand-in backed by this SQLite database, which may
+                 be ":memory:". FAKE_TERRA_LATENCY_MS and FAKE_TERRA_JITTER_MS delay each request.
+"""
+import os
+import sys
+import runpy
+import argparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook", help="herzog notebook source script, e.g. notebooks/byod/main.py")
+    args = parser.parse_args()
+    notebook = os.path.abspath(args.notebook)
+
+    if os.environ.get("FAKE_TERRA_URL") or os.environ.get("FAKE_TERRA_DB"):
+        from fake_terra import configure_from_environment
+        configure_from_environment()
+
+    profiler = None
+    if os.environ.get("HERZOG_PROFILE"):
+        from cell_profiler import CellProfiler
+        profiler = CellProfiler(notebook)
+        profiler.install()
+
+    sys.argv = [args.notebook]
+    sys.path.insert(0, os.path.dirname(notebook))
+    try:
+        runpy.run_path(notebook, run_name="__main__")
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            profiler.write(os.environ['HERZOG_PROFILE'])
+            print(profiler.summary(), file=sys.stderr)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""Execute multi-part notebook series, skipping notebooks whose sources and inputs are unchanged since their last
+successful run.
+
+Notebooks declare the artifacts they read and write in `artifacts.txt`. A series is the set of notebooks sharing a
+directory name up to a "_p{N}" suffix, e.g. GWAS_blood_pressure_p1, GWAS_blood_pressure_p2, and
+GWAS_blood_pressure_p3. Each series executes in its own working directory, and notebooks run as soon as the notebooks
+producing their inputs have completed. Independent series run concurrently.
+
+A notebook is stale if the hash of its `main.py`, `requirements.txt`, and inputs differs from its last successful run.
+Inputs found in the series working directory are hashed by content. Other inputs, e.g. data tables, are represented by
+the hash of the notebook producing them.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+
+
+REPO_ROOT = os.environ.get("BDCAT_NOTEBOOKS_HOME",
+                           os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+class Stage:
+    def __init__(self, notebook_dir: str):
+        self.notebook_dir = os.path.abspath(notebook_dir)
+        self.name = os.path.basename(self.notebook_dir)
+        self.series = re.sub(r"_p\d+$", "", self.name)
+        self.inputs: List[str] = list()
+        self.outputs: List[str] = list()
+        with open(os.path.join(self.notebook_dir, "artifacts.txt")) as fh:
+            for line in fh:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    direction, artifact = line.split(None, 1)
+                    if "in" == direction:
+                        self.inputs.append(artifact)
+                    elif "out" == direction:
+                        self.outputs.append(artifact)
+                    else:
+                        raise ValueError(f"{self.name}: expected 'in' or 'out', got '{direction}'")
+        self.upstream: Set["Stage"] = set()
+        self.key: Optional[str] = None
+
+    def __repr__(self):
+        return self.name
+
+def build_dag(stages: List[Stage]):
+    """Link each stage to the stages in its series producing its inputs."""
+    producers: Dict[tuple, Stage] = dict()
+    for s in stages:
+        for artifact in s.outputs:
+            if (s.series, artifact) in producers:
+                raise ValueError(f"'{artifact}' is produced by both {producers[(s.series, artifact)]} and {s}")
+            producers[(s.series, artifact)] = s
+    for s in stages:
+        s.upstream = {producers[(s.series, a)] for a in s.inputs if (s.series, a) in producers}
+    visiting: Set[Stage] = set()
+    done: Set[Stage] = set()
+
+    def check_acyclic(s: Stage):
+        if s in visiting:
+            raise ValueError(f"Artifact dependency cycle through {s}")
+        if s not in done:
+            visiting.add(s)
+            for u in s.upstream:
+                check_acyclic(u)
+            visiting.remove(s)
+            done.add(s)
+
+    for s in stages:
+        check_acyclic(s)
+
+def _hash_files(h, paths: List[str]):
+    for path in sorted(paths):
+        h.update(path.encode("utf-8"))
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                h.update(chunk)
+
+def stage_key(stage: Stage, workdir: str) -> str:
+    h = hashlib.sha256()
+    _hash_files(h, [os.path.join(stage.notebook_dir, f) for f in ("main.py", "requirements.txt")
+                    if os.path.isfile(os.path.join(stage.notebook_dir, f))])
+    producers = {a: u for u in stage.upstream for a in u.outputs}
+    for artifact in sorted(stage.inputs):
+        h.update(artifact.encode("utf-8"))
+        matches = [p for p in glob.glob(os.path.join(workdir, artifact)) if os.path.isfile(p)]
+        if matches:
+            _hash_files(h, matches)
+        elif artifact in producers:
+            h.update(producers[artifact].key.encode("utf-8"))
+    return h.hexdigest()
+
+class SeriesRunner:
+    def __init__(self, stages: List[Stage], workdir: str, python: str, force: bool=False):
+        self.stages = stages
+        self.workdir = os.path.abspath(workdir)
+        self.python = python
+        self.force = force
+        self.state_file = os.path.join(self.workdir, "state.json")
+        self._lock = threading.Lock()
+        if os.path.isfile(self.state_file):
+            with open(self.state_file) as fh:
+                self.state: Dict[str, str] = json.loads(fh.read())
+        else:
+            self.state = dict()
+
+    def series_workdir(self, stage: Stage) -> str:
+        return os.path.join(self.workdir, stage.series)
+
+    def _record(self, stage: Stage):
+        with self._lock:
+            self.state[stage.name] = stage.key
+            with open(self.state_file + ".tmp", "w") as fh:
+                fh.write(json.dumps(self.state, indent=2, sort_keys=True))
+            os.replace(self.state_file + ".tmp", self.state_file)
+
+    def run_stage(self, stage: Stage) -> str:
+        series_workdir = self.series_workdir(stage)
+        stage.key = stage_key(stage, series_workdir)
+        if not self.force and self.state.get(stage.name) == stage.key:
+            return "skipped"
+        cmd = [self.python, os.path.join(REPO_ROOT, "scripts", "run_notebook.py"),
+               os.path.join(stage.notebook_dir, "main.py")]
+        with open(os.path.join(series_workdir, f"{stage.name}.log"), "w") as log:
+            returncode = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=series_workdir).returncode
+        if returncode:
+            return "failed"
+        self._record(stage)
+        return "ran"
+
+    def run(self, jobs: Optional[int]=None) -> Dict[str, str]:
+        for stage in self.stages:
+            os.makedirs(self.series_workdir(stage), exist_ok=True)
+        status: Dict[str, str] = dict()
+        pending = set(self.stages)
+        running: Dict[Future, Stage] = dict()
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as e:
+            while pending or running:
+                for stage in sorted(pending, key=lambda s: s.name):
+                    if any(status.get(u.name) in ("failed", "blocked") for u in stage.upstream):
+                        status[stage.name] = "blocked"
+                        pending.remove(stage)
+                    elif all(u.name in status for u in stage.upstream):
+                        running[e.submit(self.run_stage, stage)] = stage
+                        pending.remove(stage)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    stage = running.pop(f)
+                    status[stage.name] = f.result()
+                    print("%8s" % status[stage.name], stage.name, file=sys.stderr)
+        return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook_dirs", nargs="*",
+                        help="notebook directories (default: all notebooks declaring artifacts.txt)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="maximum number of concurrent notebooks")
+    parser.add_argument("--python", default=os.environ.get("LEO_PYTHON", sys.executable),
+                        help="Python interpreter used to execute notebooks")
+    parser.add_argument("--workdir", default=os.path.join(REPO_ROOT, ".series"),
+                        help="directory containing series working directories, logs, and run state")
+    parser.add_argument("--force", action="store_true", help="execute all notebooks, even if unchanged")
+    args = parser.parse_args()
+    notebook_dirs = args.notebook_dirs or sorted(glob.glob(os.path.join(REPO_ROOT, "notebooks", "*")))
+    stages = [Stage(d) for d in notebook_dirs if os.path.isfile(os.path.join(d, "artifacts.txt"))]
+    build_dag(stages)
+    status = SeriesRunner(stages, args.workdir, args.python, args.force).run(args.jobs)
+    if any(s in ("failed", "blocked") for s in status.values()):
+        sys.exit(1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""Execute notebook scripts in parallel, recording wall time, CPU time, and peak RSS for each notebook.
+
+Notebooks are grouped by the `LEO_IMAGE` configured in `environment` and their `leo_config`, and a JSON report and
+JUnit XML report are written to the report directory. JSON reports list notebooks in a stable order so that reports
+from different runs may be diffed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+
+REPO_ROOT = os.environ.get("BDCAT_NOTEBOOKS_HOME",
+                           os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+class NotebookResult(NamedTuple):
+    notebook: str
+    leo_image: str
+    returncode: int
+    wall_time: float
+    cpu_time: float
+    peak_rss_mb: float
+    log: str
+
+    @property
+    def passed(self) -> bool:
+        return 0 == self.returncode
+
+def leo_image(notebook_dir: str) -> str:
+    """Resolve `LEO_IMAGE` the same way `run_leo_container.sh` does."""
+    leo_config = os.path.join(notebook_dir, "leo_config")
+    cmd = f"source '{os.path.join(REPO_ROOT, 'environment')}'"
+    if os.path.isfile(leo_config):
+        cmd += f" && source '{leo_config}'"
+    out = subprocess.run(["bash", "-c", cmd + ' && echo -n "${LEO_IMAGE}"'],
+                         stdout=subprocess.PIPE, check=True, cwd=REPO_ROOT)
+    return out.stdout.decode("utf-8")
+
+def _returncode(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def run_notebook(cmd: List[str], notebook: str, image: str, log_path: str) -> NotebookResult:
+    start = time.time()
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=REPO_ROOT)
+        # `os.wait4` reports resource usage for this child alone, even while other notebooks are running
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = _returncode(status)
+    # ru_maxrss is reported in kilobytes on Linux, and bytes on macOS
+    rss_scale = 1024 * 1024 if "Darwin" == platform.system() else 1024
+    return NotebookResult(notebook=notebook,
+                          leo_image=image,
+                          returncode=proc.returncode,
+                          wall_time=time.time() - start,
+                          cpu_time=rusage.ru_utime + rusage.ru_stime,
+                          peak_rss_mb=rusage.ru_maxrss / rss_scale,
+                          log=log_path)
+
+def run_all(notebook_dirs: List[str],
+            python: str,
+            report_dir: str,
+            jobs: Optional[int]=None,
+            leo_pool: bool=False) -> List[NotebookResult]:
+    images = {nb_dir: leo_image(nb_dir) for nb_dir in notebook_dirs}
+    # Dispatch notebooks sharing an image together, so that warm pooled containers are reused back to back
+    ordered = sorted(notebook_dirs, key=lambda nb_dir: (images[nb_dir], nb_dir))
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as e:
+        futures = list()
+        for nb_dir in ordered:
+            name = os.path.basename(nb_dir)
+            if leo_pool:
+                cmd = [os.path.join(REPO_ROOT, "scripts", "run_leo_container.sh"), name]
+            else:
+                cmd = [python, os.path.join(REPO_ROOT, "scripts", "run_notebook.py"), os.path.join(nb_dir, "main.py")]
+            log_path = os.path.join(report_dir, f"{name}.log")
+            futures.append(e.submit(run_notebook, cmd, name, images[nb_dir], log_path))
+        return [f.result() for f in futures]
+
+def write_json_report(results: List[NotebookResult], path: str):
+    report = {r.notebook: dict(leo_image=r.leo_image,
+                               passed=r.passed,
+                               returncode=r.returncode,
+                               wall_time=round(r.wall_time, 3),
+                               cpu_time=round(r.cpu_time, 3),
+                               peak_rss_mb=round(r.peak_rss_mb, 1))
+              for r in results}
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write(os.linesep)
+
+def write_junit_report(results: List[NotebookResult], path: str):
+    suites = ElementTree.Element("testsuites")
+    by_image: Dict[str, List[NotebookResult]] = dict()
+    for r in results:
+        by_image.setdefault(r.leo_image, list()).append(r)
+    for image, image_results in sorted(by_image.items()):
+        suite = ElementTree.SubElement(suites, "testsuite",
+                                       name=image,
+                                       tests=str(len(image_results)),
+                                       failures=str(sum(1 for r in image_results if not r.passed)),
+                                       time="%.3f" % sum(r.wall_time for r in image_results))
+        for r in sorted(image_results):
+            case = ElementTree.SubElement(suite, "testcase", classname=image, name=r.notebook, time="%.3f" % r.wall_time)
+            ElementTree.SubElement(case, "properties").extend([
+                ElementTree.Element("property", name="cpu_time", value="%.3f" % r.cpu_time),
+                ElementTree.Element("property", name="peak_rss_mb", value="%.1f" % r.peak_rss_mb),
+            ])
+            if not r.passed:
+                with open(r.log) as fh:
+                    log_tail = fh.read()[-10000:]
+                failure = ElementTree.SubElement(case, "failure", message=f"exit status {r.returncode}")
+                failure.text = log_tail
+    ElementTree.ElementTree(suites).write(path, encoding="utf-8", xml_declaration=True)
+
+def print_summary(results: List[NotebookResult]):
+    print("%-6s" % "status", "%9s" % "wall", "%9s" % "cpu", "%10s" % "peak_rss", "notebook", file=sys.stderr)
+    for r in sorted(results, key=lambda r: r.wall_time, reverse=True):
+        print("%-6s" % ("pass" if r.passed else "FAIL"),
+              "%8.1fs" % r.wall_time,
+              "%8.1fs" % r.cpu_time,
+              "%8.1fMB" % r.peak_rss_mb,
+              r.notebook,
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("notebook_dirs", nargs="*", help="notebook directories (default: all notebooks)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="maximum number of concurrent notebooks")
+    parser.add_argument("--python", default=os.environ.get("LEO_PYTHON", sys.executable),
+                        help="Python interpreter used to execute notebooks")
+    parser.add_argument("--report-dir", default=os.path.join(REPO_ROOT, "test-reports"),
+                        help="directory for notebook logs, report.json, and junit.xml")
+    parser.add_argument("--leo-pool", action="store_true",
+                        help=("execute notebooks in pooled Leo containers with run_leo_container.sh. "
+                              "CPU time and peak RSS then describe the docker client, not the notebook."))
+    args = parser.parse_args()
+    notebook_dirs = args.notebook_dirs or sorted(os.path.join(REPO_ROOT, "notebooks", d)
+                                                 for d in os.listdir(os.path.join(REPO_ROOT, "notebooks")))
+    notebook_dirs = [os.path.abspath(d) for d in notebook_dirs if os.path.isfile(os.path.join(d, "main.py"))]
+    if args.leo_pool:
+        os.environ['LEO_CONTAINER_POOL'] = "true"
+    os.makedirs(args.report_dir, exist_ok=True)
+    results = run_all(notebook_dirs, args.python, args.report_dir, args.jobs, args.leo_pool)
+    write_json_report(results, os.path.join(args.report_dir, "report.json"))
+    write_junit_report(results, os.path.join(args.report_dir, "junit.xml"))
+    print_summary(results)
+    if not all(r.passed for r in results):
+        sys.exit(1)